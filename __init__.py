@@ -1,11 +1,26 @@
 
 from . import lab
+from . import keyframe
+from . import schedule
+from . import cache
+from . import instrument
+from . import audio
+from . import live
 from bpy_extras.io_utils import ImportHelper
-from bpy.types import Operator, AddonPreferences, Panel, UIList, PropertyGroup, Action, Context, ShapeKey
+from bpy.types import Operator, AddonPreferences, Panel, UIList, PropertyGroup, Action, Context, OperatorFileListElement
 from bpy.props import *
 import bpy
+from bpy.app.handlers import persistent
+from concurrent.futures import ThreadPoolExecutor
 from copy import copy
-import re
+from functools import partial
+from collections import Counter
+import csv
+import math
+import os
+import time
+import uuid
+import wave
 
 
 bl_info = {
@@ -26,6 +41,18 @@ if "bpy" in locals():
     import importlib
     if "lab" in locals():
         importlib.reload(lab)
+    if "keyframe" in locals():
+        importlib.reload(keyframe)
+    if "schedule" in locals():
+        importlib.reload(schedule)
+    if "cache" in locals():
+        importlib.reload(cache)
+    if "instrument" in locals():
+        importlib.reload(instrument)
+    if "audio" in locals():
+        importlib.reload(audio)
+    if "live" in locals():
+        importlib.reload(live)
 
 
 class IMPLAB_MT_AddonPreferences(AddonPreferences):
@@ -35,11 +62,48 @@ class IMPLAB_MT_AddonPreferences(AddonPreferences):
                                 description="Display on side panel of Dope Sheet", default=True)
     ui_nlaeditor = BoolProperty(name="Display to LNA Editor",
                                 description="Display on side panel of LNA Editor", default=True)
+    cache_budget: IntProperty(
+        name="キャッシュ容量 (MB)", description="解析済みの.labファイルを保持するメモリの上限。0でキャッシュしない。これより大きいファイルはキャッシュせずに読みながら挿入する", default=64, min=0)
+    cache_hash: BoolProperty(
+        name="内容で確認", description="更新時刻とサイズに加えてファイル内容のハッシュでキャッシュの有効性を確認する", default=False)
+    trace: BoolProperty(
+        name="トレースを保存", description="挿入の段階ごとの時間と件数をJSONファイルに書き出す", default=False)
+    trace_dir: StringProperty(
+        name="保存先", description="トレースファイルの保存先。空欄ならBlenderの一時フォルダ", subtype='DIR_PATH', default="")
+    disk_cache_dir: StringProperty(
+        name="ディスクキャッシュ", description="生成したキーフレームの配列を保存し、同じ.labと口形素の対応で使い回すフォルダ。空欄なら使わない", subtype='DIR_PATH', default="")
+    disk_cache_limit: IntProperty(
+        name="上限 (MB)", description="ディスクキャッシュの合計サイズの上限。超えたら古いものから削除する", default=512, min=1)
+
+    def draw(self, context):
+        layout = self.layout
+        row = layout.row()
+        row.prop(self, "cache_budget")
+        row.prop(self, "cache_hash")
+        labs = cache.labs
+        layout.label(
+            text=f"キャッシュ : {len(labs)} ファイル {labs.size / (1 << 20):.1f} MB  ヒット {labs.hits}  ミス {labs.misses}")
+        row = layout.row()
+        row.prop(self, "trace")
+        row.prop(self, "trace_dir")
+        row = layout.row()
+        row.prop(self, "disk_cache_dir")
+        row.prop(self, "disk_cache_limit")
+        if self.disk_cache_dir:
+            disk = cache.disk
+            row = layout.row()
+            row.label(text=f"ディスクキャッシュ : ヒット {disk.hits}  ミス {disk.misses}")
+            row.operator(IMPLAB_OT_CLEAR_DISK_CACHE.bl_idname)
+
+
+def invalidate_profile(self, context):
+    # 口形素スロットが編集されたらプロファイルを作り直す（プロパティのupdateからも呼ばれる）
+    cache.profiles.invalidate(self.id_data.as_pointer())
 
 
 class ImplabActionPointer(PropertyGroup):
-    viseme: StringProperty(override={"LIBRARY_OVERRIDABLE"})
-    pose: PointerProperty(type=Action, override={"LIBRARY_OVERRIDABLE"})
+    viseme: StringProperty(override={"LIBRARY_OVERRIDABLE"}, update=invalidate_profile)
+    pose: PointerProperty(type=Action, override={"LIBRARY_OVERRIDABLE"}, update=invalidate_profile)
 
 
 class ImplabPropertyGroup(PropertyGroup):
@@ -59,21 +123,33 @@ class ImplabPropertyGroup(PropertyGroup):
         "Active Index", override={"LIBRARY_OVERRIDABLE"})
 
 
+def shapekey_items(key) -> tuple[list, dict[str, int]]:
+    '''
+    シェイプキーの列挙項目と、名前 -> 番号の辞書
+    シェイプキーの数と名前が変わるまでメッシュ（Key）ごとに使い回す
+    '''
+    names = key.key_blocks.keys()
+    signature = (len(names), hash(tuple(names)))
+
+    def compile():
+        items = [(name, name, "シェイプキー", "SHAPEKEY_DATA", i)
+                 for i, name in enumerate(names)]
+        return items, {name: i for i, name in enumerate(names)}
+    return cache.shapekeys.get(key.as_pointer(), signature, compile)
+
+
 class ImplabShapekeyPointer(PropertyGroup):
-    shapekey_list = []
+    no_items = []
 
     def getShapeKeyList(self, context):
-        obj = context.active_object
-        items = []
-        if obj.type == 'MESH':
-            for i, item in enumerate(obj.data.shape_keys.key_blocks):
-                items.append(
-                    (item.name, item.name, "シェイプキー", "SHAPEKEY_DATA", i))
-        ImplabShapekeyPointer.shapekey_list = items
-        return items
+        # Blenderが参照している間はリストを保持しておく必要があるので、キャッシュのリストを返す
+        key = self.id_data.shape_keys
+        if key is None:
+            return ImplabShapekeyPointer.no_items
+        return shapekey_items(key)[0]
 
-    viseme: StringProperty(override={"LIBRARY_OVERRIDABLE"})
-    pose: EnumProperty(items=getShapeKeyList, override={"LIBRARY_OVERRIDABLE"})
+    viseme: StringProperty(override={"LIBRARY_OVERRIDABLE"}, update=invalidate_profile)
+    pose: EnumProperty(items=getShapeKeyList, override={"LIBRARY_OVERRIDABLE"}, update=invalidate_profile)
 
 
 class ImplabMeshPropertyGroup(PropertyGroup):
@@ -93,7 +169,687 @@ class ImplabMeshPropertyGroup(PropertyGroup):
         "Active Index", override={"LIBRARY_OVERRIDABLE"})
 
 
-class IMPLAB_OT_INSERT(Operator, ImportHelper):
+def compile_pose(action: Action) -> schedule.pose_template:
+    # 音素のFカーブごとに最後のキーフレームの値をポーズとする
+    channels, values = [], []
+    for fcurve in action.fcurves:
+        if not fcurve.keyframe_points:
+            continue
+        group = fcurve.group.name if fcurve.group else ''
+        channels.append((fcurve.data_path, fcurve.array_index, group))
+        values.append(fcurve.keyframe_points[-1].co[1])
+    return schedule.pose_template(channels, values)
+
+
+def pose_template(action: Action) -> schedule.pose_template:
+    # ポーズアクションが変更されるまでテンプレートを使い回す
+    # 同じ名前で作り直されたアクションは別のものとして扱う
+    signature = (action.as_pointer(), len(action.fcurves),
+                 sum(len(fcurve.keyframe_points) for fcurve in action.fcurves))
+    return cache.poses.get(action.name_full, signature, lambda: compile_pose(action))
+
+
+_action_count = 0  # 前回の更新でのアクションの数
+
+
+@persistent
+def invalidate_pose_templates(scene, depsgraph=None):
+    # ファイルの読み込みやアンドゥの後は全て、それ以外は編集されたポーズアクションのテンプレートだけ作り直す
+    # 挿入で作ったアクションの更新では消さない
+    # アクションが削除されたら、それを指しているかもしれないテンプレートとプロファイルを全て捨てる
+    global _action_count
+    if depsgraph is None:
+        cache.poses.invalidate()
+        return
+    count, _action_count = _action_count, len(bpy.data.actions)
+    if _action_count < count:
+        cache.poses.invalidate()
+        cache.profiles.invalidate()
+        return
+    if not len(cache.poses) or not depsgraph.id_type_updated('ACTION'):
+        return
+    for update in depsgraph.updates:
+        if isinstance(update.id, Action):
+            cache.poses.invalidate(update.id.original.name_full)
+
+
+class viseme_profile:
+    '''
+    口形素スロットを解決したもの
+    mapping : 音素 -> ポーズ（アクションかシェイプキー名）。ポーズが無い母音は'a'、子音は'N'
+    coverage : 'OPEN_SHUT', 'VOWEL' に子音があれば '_CONSONANTS' が付く。エラーがあればNone
+    errors : スロットの問題の一覧
+    '''
+
+    def __init__(self, mapping: dict, coverage: str, errors: list[str]) -> None:
+        self.mapping = mapping
+        self.coverage = coverage
+        self.errors = errors
+
+
+def compile_profile(props) -> viseme_profile:
+    vlist = props.vowel_list
+    clist = props.consonants_list
+
+    # 音素スロットが一意か確認
+    slots = [p for p in vlist] + [p for p in clist]
+    counts = Counter(v.viseme for v in slots)
+    errors = []
+    for v in slots:
+        counts[v.viseme] -= 1
+        if counts[v.viseme] > 0:
+            errors.append(f"一意ではない音素: {v.viseme}")
+    if errors:
+        return viseme_profile({}, None, errors)
+
+    phoneme_dict = {v.viseme: v.pose for v in slots}
+    a = phoneme_dict.get('a')
+    N = phoneme_dict.get('N')
+    if a is None or N is None:
+        return viseme_profile({}, None, ["最低限のアクションが指定されていません: 'a' , 'N'"])
+
+    coverage = 'OPEN_SHUT'
+    if len(vlist) >= 3 and None not in [v.pose for v in vlist]:
+        coverage = 'VOWEL'
+    if len(clist) > 0 and None not in [v.pose for v in clist]:
+        coverage += '_CONSONANTS'
+
+    mapping = {v.viseme: v.pose if v.pose else a for v in vlist}
+    mapping |= {c.viseme: c.pose if c.pose else N for c in clist}
+    if key := getattr(props.id_data, "shape_keys", None):  # メッシュ
+        index = shapekey_items(key)[1]
+        missing = sorted({name for name in mapping.values() if name not in index})
+        if missing:
+            return viseme_profile({}, None, [f"シェイプキーがありません: {name or '(未指定)'}" for name in missing])
+    return viseme_profile(mapping, coverage, [])
+
+
+def get_profile(data) -> viseme_profile:
+    # アーマチュア、メッシュごとにスロットが編集されるまで使い回す
+    # メッシュはシェイプキーの追加、削除、名前の変更で作り直す（値の書き込みでは作り直さない）
+    # アーマチュアはポーズアクションが削除されたり、別のものに置き換えられたりしたら作り直す
+    key = getattr(data, "shape_keys", None)
+    if key is not None:
+        signature = tuple(key.key_blocks.keys())
+    else:
+        props = data.implab_props
+        signature = tuple((p.pose.name, p.pose.as_pointer()) if p.pose else None
+                          for p in (*props.vowel_list, *props.consonants_list))
+    return cache.profiles.get(data.as_pointer(), signature, lambda: compile_profile(data.implab_props))
+
+
+@persistent
+def invalidate_profiles(scene, depsgraph=None):
+    # ファイルの読み込みやアンドゥの後は作り直す
+    cache.profiles.invalidate()
+
+
+def live_target(obj):
+    # ライブモードで値を書き込むもの（リグはオブジェクト、メッシュはシェイプキー）
+    return obj if obj.type == 'ARMATURE' else obj.data.shape_keys
+
+
+def channel_owner(target, data_path: str):
+    # data_pathを(持ち主, 属性名, カスタムプロパティか)に分ける
+    if data_path.endswith('"]'):
+        i = data_path.rindex('["')
+        return (target.path_resolve(data_path[:i]) if i else target), data_path[i + 2:-2], True
+    owner, _, attr = data_path.rpartition('.')
+    return (target.path_resolve(owner) if owner else target), attr, False
+
+
+def get_channel(target, data_path: str, index: int) -> float:
+    # チャンネルの今の値。解決できなければnan
+    try:
+        owner, attr, custom = channel_owner(target, data_path)
+        value = owner[attr] if custom else getattr(owner, attr)
+        return float(value[index]) if hasattr(value, "__len__") else float(value)
+    except (ValueError, KeyError, AttributeError, IndexError, TypeError):
+        return math.nan
+
+
+def set_channel(target, data_path: str, index: int, value: float):
+    try:
+        owner, attr, custom = channel_owner(target, data_path)
+        current = owner[attr] if custom else getattr(owner, attr)
+        if hasattr(current, "__len__"):
+            current[index] = value
+        elif custom:
+            owner[attr] = value
+        else:
+            setattr(owner, attr, value)
+    except (ValueError, KeyError, AttributeError, IndexError, TypeError):
+        pass  # 削除されたボーンやシェイプキーは飛ばす
+
+
+@persistent
+def apply_live(scene, depsgraph=None):
+    # フレームが変わったら、ライブモードのオブジェクトに口形素の値を書き込む（変わったチャンネルだけ）
+    if not live.players:
+        return
+    frame = scene.frame_current + scene.frame_subframe
+    for name, player in list(live.players.items()):
+        obj = scene.objects.get(name)
+        if obj is None or "implab_live" not in obj:
+            continue
+        target = live_target(obj)
+        for i, value in player.changes(frame):
+            path, index, _ = player.channels[i]
+            set_channel(target, path, index, value)
+
+
+def stop_live(obj):
+    # ライブモードをやめて、チャンネルを元の値に戻す
+    if (player := live.players.pop(obj.name, None)) is not None:
+        target = live_target(obj)
+        for (path, index, _), value in zip(player.channels, player.rest.tolist()):
+            if not math.isnan(value):
+                set_channel(target, path, index, value)
+    if "implab_live" in obj:
+        del obj["implab_live"]
+
+
+def speech_track(obj, name: str = "LAB Speech"):
+    # アーマチュアはオブジェクト、メッシュはシェイプキーのNLAトラック
+    data = obj.animation_data if obj.type == 'ARMATURE' else getattr(obj.data.shape_keys, "animation_data", None)
+    if data and (id := data.nla_tracks.find(name)) != -1:
+        return data.nla_tracks[id]
+    return None
+
+
+def track_index(track) -> cache.strip_index:
+    # トラックのストリップの索引。ストリップの数が変わっていたら作り直す
+    key = track.as_pointer()
+    if (index := cache.tracks.get(key)) is None or index.count != len(track.strips):
+        index = cache.tracks[key] = cache.strip_index()
+        for strip in track.strips:
+            index.add(strip.name, strip.get("implab_source"), strip.get("implab_import_id", ''))
+    return index
+
+
+def source_strips(track, source: str, import_id: str = None) -> list:
+    '''
+    読み込み元（.labファイルの名前）から挿入したストリップ
+    索引の名前で引き、名前の変更などで合わなければ索引を作り直す
+    '''
+    by_name = {s.name: s for s in track.strips}  # strips.get()は1つ引くごとにトラック全体をたどる
+    for rebuild in (False, True):
+        if rebuild:
+            cache.tracks.pop(track.as_pointer(), None)
+        strips = [by_name.get(n) for n in track_index(track).names(source, import_id)]
+        if all(s is not None and s.get("implab_source", source) == source for s in strips):
+            return strips
+    return [s for s in strips if s is not None and s.get("implab_source", source) == source]
+
+
+def remove_strip(track, strip):
+    track_index(track).discard(strip.name, strip.get("implab_source"))
+    action = strip.action
+    track.strips.remove(strip)
+    # 他のオブジェクトのストリップと共有しているアクションは残す
+    if action and action.users <= int(action.use_fake_user):
+        bpy.data.actions.remove(action)
+
+
+def new_import_id() -> str:
+    # 挿入ごとのID（日時と乱数）
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:4]}"
+
+
+@persistent
+def invalidate_strip_indexes(scene, depsgraph=None):
+    # ファイルの読み込みやアンドゥの後はストリップが作り直されるので索引を捨てる
+    cache.tracks.clear()
+
+
+class ImplabInsertBase:
+    '''
+    挿入オペレーター共通の処理
+    音素アクションをチェック
+    台詞アクションを作る
+    NLAトラックを作る
+    NLAトラックにアクションを挿入
+    '''
+    target: StringProperty(default="", options={'HIDDEN'})
+    overwrite: BoolProperty(
+        name="上書き", description="選択したファイルと同じ名前のアクションとストリップを削除してから生成、挿入します", default=True)
+    use_scale: BoolProperty(
+        name="Use Scale", description="固定フレームレートのアクションを生成し、再生スケールで調整する")
+    incremental: BoolProperty(
+        name="差分更新", description="内容が変わった文のストリップとアクションだけを作り直す。位置だけ変わった文はストリップを移動する", default=False)
+    decimate: BoolProperty(
+        name="キーを間引く", description="同じ口形素が続く発音をまとめ、補間で再現できるキーフレームを削除する", default=False)
+    decimate_tolerance: FloatProperty(
+        name="許容誤差", description="間引くキーフレームの値の誤差の上限", default=0.001, min=0.0, precision=4)
+    output: EnumProperty(
+        name="出力",
+        items=(('SENTENCE', "文ごと", "文ごとにアクションとストリップを作る（編集向け）"),
+               ('SINGLE', "まとめる", "ファイル全体（または指定した時間ごと）を1つのアクションとストリップにする。文の区切りはポーズマーカーに残す")),
+        default='SENTENCE')
+    chunk_minutes: FloatProperty(
+        name="分割（分）", description="まとめる場合に、この時間ごとにアクションを分ける。0なら分けない", default=0.0, min=0.0)
+    use_audio: BoolProperty(
+        name="音量で強弱", description="WAVファイルの音量で口の開きを変える。リグは'N'のポーズとの間で補間する", default=False)
+    audio_floor: FloatProperty(
+        name="最小の強さ", description="最も小さい音のときの口の開き", default=0.3, min=0.0, max=1.0)
+    engine: EnumProperty(
+        name="生成方法",
+        items=(('KEYS', "音素ごと", "音素ごとにポーズのキーフレームを打つ"),
+               ('COARTICULATION', "調音結合", "前後の音素の重なりを優位度で混ぜた値をフレームごとのキーフレームにする")),
+        default='KEYS')
+    blend_shape: EnumProperty(
+        name="立ち上がりの形", description="調音結合で発音の前後に口形素が現れ、消えていく形",
+        items=(('SMOOTH', "滑らか", "smoothstep"),
+               ('LINEAR', "直線", "一定の速さ"),
+               ('GAUSSIAN', "ガウス", "発音の近くで強く、離れると急に弱くなる")),
+        default='SMOOTH')
+    attack_time: FloatProperty(
+        name="立ち上がり（秒）", description="調音結合で発音の開始より前に口形素が現れ始める時間", default=0.08, min=0.0, max=1.0)
+    decay_time: FloatProperty(
+        name="減衰（秒）", description="調音結合で発音の終了から口形素が消えるまでの時間", default=0.12, min=0.0, max=1.0)
+    simplify_tolerance: FloatProperty(
+        name="キーの許容誤差", description="調音結合でフレームごとのキーを間引くときの値の誤差の上限（チャンネルごとのポーズの差分に対する比）。"
+        "0なら値が変わらない区間だけを間引く", default=schedule.SIMPLIFY_TOLERANCE, min=0.0, max=0.5, precision=3)
+
+    def phoneme_check(self, context: Context) -> tuple[str, viseme_profile]:
+        profile = get_profile(context.active_object.data)
+        for error in profile.errors:
+            self.report({'ERROR'}, error)
+        if profile.coverage is None:
+            return None, None
+        return profile.coverage, profile
+
+    def owned_strips(self, context: Context, name: str) -> tuple:
+        # "LAB Speech"トラックと、そのうちファイル名から挿入したストリップ
+        if (track := speech_track(context.active_object)) is None:
+            return None, []
+        return track, source_strips(track, name)
+
+    def overwrite_preprocess(self, context: Context, name: str):
+        track, owned = self.owned_strips(context, name)
+        for strip in owned:
+            remove_strip(track, strip)
+
+    def owned_actions(self, context: Context, name: str) -> dict[str, Action]:
+        # 既存のストリップのアクション（指紋 -> アクション）
+        _, owned = self.owned_strips(context, name)
+        return {s["implab_fingerprint"]: s.action for s in owned
+                if s.action and s.get("implab_fingerprint")}
+
+    def incremental_update(self, context: Context, schedules: list[schedule.sentence_schedule], current_frame: float, name: str) -> list[int]:
+        '''
+        差分更新
+        指紋が同じ文のストリップは残し、位置だけ違う場合は移動する
+        残らなかったストリップは削除し、作り直しが必要な文の番号を返す
+        '''
+        track, owned = self.owned_strips(context, name)
+        rebuild, kept, moves = self.match_strips(schedules, owned, current_frame)
+
+        kept_names = {k.name for k in kept}
+        for strip in owned:
+            if strip.name not in kept_names:
+                remove_strip(track, strip)
+
+        # 他のストリップと重ならないよう、移動する向きの先にあるものから動かす
+        left = sorted([m for m in moves if m[1] < m[0].frame_start],
+                      key=lambda m: m[0].frame_start)
+        right = sorted([m for m in moves if m[1] > m[0].frame_start],
+                       key=lambda m: m[0].frame_start, reverse=True)
+        for strip, frame in left + right:
+            self.move_strip(strip, frame)
+        return rebuild
+
+    @staticmethod
+    def match_strips(schedules: list[schedule.sentence_schedule], owned: list, current_frame: float) -> tuple[list[int], list, list]:
+        # 文と既存のストリップの対応（作り直す文の番号, 残すストリップ, (移動するストリップ, フレーム)）
+        existing: dict[str, list] = {}
+        for strip in owned:
+            existing.setdefault(strip.get("implab_fingerprint"), []).append(strip)
+        existing.pop(None, None)
+
+        rebuild = []
+        kept = []
+        moves = []
+        for i, sentence in enumerate(schedules):
+            frame = int(sentence.start + current_frame)
+            if not (candidates := existing.get(sentence.fingerprint)):
+                rebuild.append(i)
+                continue
+            strip = min(candidates, key=lambda s: abs(s.frame_start - frame))
+            candidates.remove(strip)
+            kept.append(strip)
+            if strip.frame_start != frame:
+                moves.append((strip, frame))
+        return rebuild, kept, moves
+
+    @staticmethod
+    def move_strip(strip, frame: float):
+        if hasattr(strip, "frame_start_ui"):
+            strip.frame_start_ui = frame
+            return
+        length = strip.frame_end - strip.frame_start
+        if frame > strip.frame_start:
+            strip.frame_end = frame + length
+            strip.frame_start = frame
+        else:
+            strip.frame_start = frame
+            strip.frame_end = frame + length
+
+    def use_cache(self, context: Context) -> bool:
+        # キャッシュの設定を反映する（メインスレッドで呼ぶ）
+        prefs = context.preferences.addons[__package__].preferences
+        cache.labs.configure(prefs.cache_budget << 20, prefs.cache_hash)
+        return prefs.cache_budget > 0
+
+    def use_disk_cache(self, context: Context) -> bool:
+        prefs = context.preferences.addons[__package__].preferences
+        directory = bpy.path.abspath(prefs.disk_cache_dir) if prefs.disk_cache_dir else ''
+        cache.disk.configure(directory, prefs.disk_cache_limit << 20)
+        return bool(directory)
+
+    def disk_key(self, context: Context, filepath: str, visemes: schedule.viseme_map) -> str:
+        # .labの内容、口形素の対応、フレームレートと生成の設定から作るディスクキャッシュのキー
+        return cache.disk.key(
+            schedule.VERSION, cache.file_hash(filepath), os.path.splitext(filepath)[1].lower(),
+            visemes.channels, visemes.digest(), self.target, self.use_scale, context.scene.render.fps,
+            self.decimate and self.decimate_tolerance, self.output, self.output == 'SINGLE' and self.chunk_minutes,
+            self.loudness.digest() if self.loudness is not None else None,
+            self.schedule_tag(context), self.engine == 'COARTICULATION' and repr(self.blend_kernel()))
+
+    def file_schedules(self, context: Context, filepath: str, visemes: schedule.viseme_map,
+                       sentence: list[lab.lab_words] = None) -> list[schedule.sentence_schedule]:
+        '''
+        ファイル全体の予定表
+        ディスクキャッシュにあれば、.labの読み込みと予定表の生成を省く
+        sentence : 読み込み済みの文。無ければ読み込む
+        '''
+        trace = self.trace
+        key = None
+        if self.use_disk_cache(context):
+            with trace.stage("disk_cache"):
+                key = self.disk_key(context, filepath, visemes)
+                arrays = cache.disk.load(key)
+            if arrays is not None:
+                trace.count("disk_hits")
+                return schedule.unpack_schedules(arrays)
+            trace.count("disk_misses")
+        if sentence is None:
+            sentence = self.load_lab(filepath, self.use_cache(context), trace)[1]
+        schedules = self.prepare_schedules(context, sentence, visemes)
+        if key is not None:
+            with trace.stage("disk_cache"):
+                try:
+                    cache.disk.store(key, schedule.pack_schedules(schedules))
+                except OSError as e:
+                    self.report({'WARNING'}, f"ディスクキャッシュに保存できません: {e}")
+        return schedules
+
+    @staticmethod
+    def load_lab(filepath: str, use_cache: bool, trace: instrument.trace = None) -> tuple[lab.lab_words, list[lab.lab_words]]:
+        trace = trace or instrument.trace()
+
+        def load(filepath):
+            with trace.stage("parse"):
+                words = lab.load(filepath)
+            with trace.stage("split"):
+                return words, words.split()
+        if not use_cache:
+            return load(filepath)
+        missed = False
+
+        def miss(filepath):
+            nonlocal missed
+            missed = True
+            return load(filepath)
+        loaded = cache.labs.get(filepath, miss, lab.sidecar_path(filepath))
+        trace.count("lab_cache_misses" if missed else "lab_cache_hits")
+        return loaded
+
+    def build_visemes(self, context: Context, profile: viseme_profile) -> schedule.viseme_map:
+        match self.target:
+            case 'ARMATURE':
+                return self.rig_visemes(context, profile)
+            case 'MESH':
+                return self.shapekey_visemes(context, profile)
+
+    def rig_visemes(self, context: Context, profile: viseme_profile) -> schedule.viseme_map:
+        visemes = schedule.viseme_map()
+        for p, action in profile.mapping.items():
+            visemes.set_template(p, pose_template(action))
+        return visemes
+
+    def shapekey_visemes(self, context: Context, profile: viseme_profile) -> schedule.viseme_map:
+        visemes = schedule.viseme_map()
+        for p, shapekey in profile.mapping.items():
+            visemes.set_pose(
+                p, [visemes.channel(f"key_blocks[\"{shapekey}\"].value")], [1.0])
+        return visemes
+
+    def build_live(self, context: Context, filepath: str, frame: float, rest: list[float] = None) -> live.player:
+        '''
+        ライブモードの索引を作る（キーフレームは打たない）
+        rest : チャンネルごとの文の外での値。無ければ今の値
+        '''
+        trace = self.trace
+        with trace.stage("phoneme_check"):
+            covering, profile = self.phoneme_check(context)
+        if not covering:
+            return None
+        with trace.stage("visemes"):
+            visemes = self.build_visemes(context, profile)
+        schedules = self.file_schedules(context, filepath, visemes)
+        target = live_target(context.active_object)
+        if rest is None or len(rest) != len(visemes.channels):
+            rest = [get_channel(target, path, index) for path, index, _ in visemes.channels]
+        scale = context.scene.render.fps / 100.0 if self.use_scale else 1.0
+        with trace.stage("live_index"):
+            return live.player.from_schedules(
+                self.target, visemes.channels, rest, schedules, frame, scale,
+                context.preferences.edit.keyframe_new_interpolation_type)
+
+    def insert_sentences(self, context: Context, sentence: list[lab.lab_words], visemes: schedule.viseme_map,
+                         actionname: str, track, current_frame: float, first: bool = True,
+                         shared: dict[str, Action] = None) -> int:
+        '''
+        台詞ごとにキーフレームの予定表を作り、アクションに書き出してトラックに挿入する
+        first : sentenceの先頭がファイル先頭の文かどうか
+        shared : 指紋 -> アクション。あればそのアクションを使い、作ったアクションを追加する
+        作ったアクションの数を返す
+        '''
+        schedules = self.prepare_schedules(context, sentence, visemes, first)
+        return self.insert_schedules(context, schedules, visemes, actionname, track, current_frame, shared)
+
+    def insert_schedules(self, context: Context, schedules: list[schedule.sentence_schedule], visemes: schedule.viseme_map,
+                         actionname: str, track, current_frame: float, shared: dict[str, Action] = None) -> int:
+        # 予定表をアクションに書き出してトラックに挿入し、作ったアクションの数を返す
+        trace = self.trace
+        if self.incremental:
+            with trace.stage("incremental"):
+                rebuild = self.incremental_update(
+                    context, schedules, current_frame, actionname)
+            schedules = [schedules[i] for i in rebuild]
+        with trace.stage("generate"):
+            if shared is None:
+                actions = generated = self.generate_action(
+                    context, schedules, visemes, actionname)
+            else:  # 指紋が同じ文はアクションを共有する
+                missing = {s.fingerprint: s for s in schedules if s.fingerprint not in shared}
+                generated = self.generate_action(
+                    context, list(missing.values()), visemes, actionname)
+                shared.update(zip(missing, generated))
+                actions = [shared[s.fingerprint] for s in schedules]
+        trace.count("actions", len(generated))
+        with trace.stage("insert_action_in_track"):
+            self.insert_action_in_track(
+                context, schedules, actions, track, current_frame)
+        return len(generated)
+
+    def prepare_schedules(self, context: Context, sentence: list[lab.lab_words], visemes: schedule.viseme_map,
+                          first: bool = True) -> list[schedule.sentence_schedule]:
+        # 出力の設定に合わせた予定表（まとめる場合は指定した時間ごとにつなげる）
+        with self.trace.stage("schedule"):
+            schedules = self.build_schedules(context, sentence, visemes, first)
+            self.trace.count("sentences", len(schedules))
+            if self.output == 'SINGLE' and schedules:
+                length = self.chunk_minutes * 60 * context.scene.render.fps or None
+                schedules = schedule.chunk_schedules(schedules, length)
+        return schedules
+
+    def schedule_tag(self, context: Context) -> str:
+        # キーの補間方法と間引きの設定。変わったら作り直す（文の指紋とディスクキャッシュのキーに入れる）
+        tag = f"interpolation={context.preferences.edit.keyframe_new_interpolation_type}"
+        if self.decimate:
+            tag += f"+decimate={self.decimate_tolerance}"
+        if self.engine == 'COARTICULATION':
+            tag += f"+simplify={self.simplify_tolerance}"
+        return tag
+
+    def build_schedules(self, context: Context, sentence: list[lab.lab_words], visemes: schedule.viseme_map,
+                        first: bool = True) -> list[schedule.sentence_schedule]:
+        fps = 100 if self.use_scale else context.scene.render.fps
+        interpolation = context.preferences.edit.keyframe_new_interpolation_type
+        tag = self.schedule_tag(context)
+        if self.engine == 'COARTICULATION':
+            # 文の後の減衰を次の文の手前で止めるので、ファイルの全ての文をまとめて作る
+            # フレームごとのキーは補間で再現できる分を間引く（ベジェは直線として測る）
+            rest = schedule.channel_rest(visemes) if self.target == 'ARMATURE' else None
+            simplify = None
+            if self.simplify_tolerance > 0:
+                simplify = partial(keyframe.decimate, tolerance=self.simplify_tolerance,
+                                   interpolation='CONSTANT' if interpolation == 'CONSTANT' else 'LINEAR')
+            return schedule.coarticulation_schedules(
+                sentence, visemes, fps, context.scene.render.fps, first, self.decimate,
+                tag, self.loudness, rest, self.blend_kernel(), simplify)
+        match self.target:
+            case 'ARMATURE':
+                func = schedule.rig_schedule
+            case 'MESH':
+                func = schedule.shapekey_schedule
+        return [func(words, visemes, fps, context.scene.render.fps, first and i == 0, self.decimate, tag, self.loudness)
+                for i, words in enumerate(sentence)]
+
+    def blend_kernel(self) -> schedule.blend_kernel:
+        return schedule.blend_kernel(self.blend_shape, self.attack_time, self.decay_time)
+
+    def load_loudness(self, filepath: str, audio_path: str = '') -> audio.envelope:
+        # 音量の包絡線（指定が無ければ.labと同じ名前の.wav）
+        if not self.use_audio:
+            return None
+        path = bpy.path.abspath(audio_path) if audio_path else os.path.splitext(filepath)[0] + ".wav"
+        try:
+            with self.trace.stage("audio"):
+                return audio.envelope.from_wav(path, floor=self.audio_floor)
+        except (OSError, EOFError, wave.Error) as e:
+            self.report({'WARNING'}, f"音声を読み込めません: {path} ({e})")
+            return None
+
+    def generate_action(self, context: Context, schedules: list[schedule.sentence_schedule], visemes: schedule.viseme_map,
+                        actionname: str) -> list[Action]:
+        interpolation = self.keyframe_interpolation(context)
+        decimate = context.preferences.edit.keyframe_new_interpolation_type if self.decimate else None
+        return [self.write_action(s, visemes, actionname, interpolation, decimate) for s in schedules]
+
+    def write_action(self, sentence: schedule.sentence_schedule, visemes: schedule.viseme_map,
+                     actionname: str, interpolation: int, decimate: str = None) -> Action:
+        '''
+        decimate : 間引きに使う補間方法の名前。Noneなら間引かない
+        '''
+        act: Action = bpy.data.actions.new(actionname)
+        act["implab_source"] = actionname
+        act["implab_import_id"] = self.import_id
+        for channel, frames, values in sentence.curves():  # Fカーブごとにまとめて打ち込む
+            if decimate:
+                keep = keyframe.decimate(
+                    frames, values, self.decimate_tolerance, decimate)
+                self.trace.count("removed_keys", len(keep) - int(keep.sum()))
+                frames, values = frames[keep], values[keep]
+            data_path, index, group = visemes.channels[channel]
+            fcurve = act.fcurves.new(
+                data_path, index=index, action_group=group)
+            keyframe.bulk_insert(fcurve, frames, values, interpolation)
+            self.trace.count("fcurves")
+            self.trace.count("keys", len(frames))
+            fcurve.update()
+        if sentence.bounds:  # まとめたアクションには文の区切りを残す
+            for i, frame in enumerate(sentence.bounds):
+                marker = act.pose_markers.new(f"文{i + 1}")
+                marker.frame = int(round(frame))
+            act["implab_sentence_frames"] = sentence.bounds
+        act.use_fake_user = True
+        return act
+
+    def report_decimation(self):
+        if self.decimate:
+            self.report(
+                {'INFO'}, f"{self.trace.counters.get('removed_keys', 0)} 個のキーフレームを間引きました")
+
+    def report_trace(self, context: Context):
+        # 計測結果を表示し、設定されていればJSONファイルに書き出す
+        self.report({'INFO'}, f"IMPLAB : {self.trace.summary()}")
+        prefs = context.preferences.addons[__package__].preferences
+        if not prefs.trace:
+            return
+        directory = bpy.path.abspath(prefs.trace_dir) if prefs.trace_dir else bpy.app.tempdir
+        path = self.trace.write(
+            directory,
+            blender=bpy.app.version_string,
+            operator=self.bl_idname,
+            object=context.active_object.name,
+            target=self.target,
+            fps=context.scene.render.fps,
+            settings={k: getattr(self, k) for k in (
+                "overwrite", "use_scale", "incremental", "decimate", "decimate_tolerance", "engine",
+                "simplify_tolerance")},
+        )
+        print(f"IMPLAB : Trace {path}")
+
+    def keyframe_interpolation(self, context: Context) -> int:
+        # 新規キーフレームの補間方法(ユーザー設定)を列挙値にする
+        name = context.preferences.edit.keyframe_new_interpolation_type
+        return bpy.types.Keyframe.bl_rna.properties['interpolation'].enum_items[name].value
+
+    def create_track(self, context: Context, name: str = "LAB Speech"):
+        obj = context.active_object
+
+        match obj.type:
+            case 'ARMATURE':
+                target = obj
+            case 'MESH':
+                target = obj.data.shape_keys
+
+        if not target.animation_data:
+            target.animation_data_create()
+        nla_tracks = target.animation_data.nla_tracks
+
+        if (id := nla_tracks.find(name)) != -1:
+            return nla_tracks[id]
+        else:
+            track = nla_tracks.new()
+            track.name = name
+            return track
+
+    def insert_action_in_track(self, context: Context, schedules: list[schedule.sentence_schedule], action_list: list[Action], track, current_frame: float):
+        obj = context.active_object
+        index = track_index(track)
+
+        for sentence, action in zip(schedules, action_list):
+            insert_frame = sentence.start + current_frame
+
+            strip = track.strips.new(action.name, int(insert_frame), action)
+            strip.extrapolation = 'NOTHING'
+            strip["implab_fingerprint"] = sentence.fingerprint
+            # 読み込み元はアクションのもの（共有したアクションでも同じ）、読み込みIDはこの挿入のもの
+            strip["implab_source"] = source = action.get("implab_source", action.name)
+            strip["implab_import_id"] = self.import_id
+            index.add(strip.name, source, self.import_id)
+            if self.use_scale:
+                strip.scale = context.scene.render.fps / 100.0
+
+        # for index in range(len(action_list[1:])):
+        #     bpy.ops.nla.transition_add()
+
+
+class IMPLAB_OT_INSERT(ImplabInsertBase, Operator, ImportHelper):
     '''
     音素アクションをチェック
     台詞アクションを作る
@@ -107,12 +863,13 @@ class IMPLAB_OT_INSERT(Operator, ImportHelper):
 
     filename_ext = ".lab"
     filter_glob: StringProperty(
-        default="*.lab", options={'HIDDEN'}, maxlen=255)
-    target: StringProperty(default="", options={'HIDDEN'})
-    overwrite: BoolProperty(
-        name="上書き", description="選択したファイルと同じ名前のアクションとストリップを削除してから生成、挿入します", default=True)
-    use_scale: BoolProperty(
-        name="Use Scale", description="固定フレームレートのアクションを生成し、再生スケールで調整する")
+        default=";".join(f"*{ext}" for ext in lab.extensions()), options={'HIDDEN'}, maxlen=255)
+    all_selected: BoolProperty(
+        name="選択した全てのオブジェクト", description="選択した同じ種類のオブジェクト全てに挿入する。口形素の対応が同じオブジェクトはアクションを共有する", default=False)
+    object_offset: FloatProperty(
+        name="オブジェクトごとのずらし（秒）", description="選択した全てのオブジェクトに挿入する場合に、オブジェクトごとに挿入位置をずらす時間", default=0.0)
+    audio_path: StringProperty(
+        name="音声ファイル", description="音量で強弱を付けるWAVファイル。空欄なら.labと同じ名前の.wav", subtype='FILE_PATH', default="")
 
     def execute(self, context):
         print("IMPLAB : Insert Start")
@@ -121,204 +878,587 @@ class IMPLAB_OT_INSERT(Operator, ImportHelper):
         consonants_list = props.consonants_list
         fps = context.scene.render.fps
         frametime = 1.0 / fps
+        name = bpy.path.display_name_from_filepath(self.filepath)
+        trace = self.trace = instrument.trace(name)
+        self.import_id = new_import_id()
+        self.loudness = self.load_loudness(self.filepath, self.audio_path)
+
+        if len(objects := self.target_objects(context)) > 1:
+            self.fan_out(context, objects, name)
+            self.report_decimation()
+            self.report_trace(context)
+            return {"FINISHED"}
+
+        with trace.stage("phoneme_check"):
+            covering, profile = self.phoneme_check(context)
+        if self.overwrite and not self.incremental:
+            with trace.stage("overwrite_preprocess"):
+                self.overwrite_preprocess(context, name)
+        if not covering:
+            return {"FINISHED"}
+        with trace.stage("visemes"):
+            visemes = self.build_visemes(context, profile)
+        with trace.stage("create_track"):
+            track = self.create_track(context)
+        frame = context.scene.frame_current
+
+        # キャッシュに入らない大きさのファイルは、キャッシュを使わずに読みながら挿入する
+        use_cache = self.use_cache(context) and cache.labs.fits(self.filepath)
+        # 調音結合は次の文を見て減衰を止めるので、文ごとに挿入しない
+        if use_cache or self.incremental or self.output != 'SENTENCE' or lab.sidecar(self.filepath) \
+                or not lab.native(self.filepath) or self.use_disk_cache(context) or self.engine == 'COARTICULATION':
+            schedules = self.file_schedules(context, self.filepath, visemes)
+            count = self.insert_schedules(
+                context, schedules, visemes, name, track, frame)
+            if self.incremental:
+                self.report(
+                    {'INFO'}, f"{len(schedules)} 文のうち {count} 文を作り直しました")
+        else:  # 文の区切りが確定するたびに生成、挿入する
+            # 読み込みと分割は同時に進むので、まとめて"read_sentences"として計測する
+            for i, words in enumerate(trace.iterate("read_sentences", lab.read_sentences(self.filepath))):
+                self.insert_sentences(
+                    context, [words], visemes, name, track, frame, first=i == 0)
+
+        self.report_decimation()
+        self.report_trace(context)
+        return {"FINISHED"}
+
+    def target_objects(self, context: Context) -> list:
+        # 挿入先のオブジェクト（アクティブなオブジェクトが先頭）
+        obj = context.active_object
+        if not self.all_selected:
+            return [obj]
+        objects = [obj]
+        data = {obj.data.as_pointer()}
+        for o in context.selected_objects:
+            # メッシュを共有するオブジェクトはシェイプキーのトラックも共有するので1回だけ
+            if o.type == obj.type and o not in objects and (o.type != 'MESH' or o.data.as_pointer() not in data):
+                objects.append(o)
+                data.add(o.data.as_pointer())
+        return objects
+
+    def fan_out(self, context: Context, objects: list, name: str):
+        '''
+        複数のオブジェクトに挿入する
+        口形素の対応が同じオブジェクトは最初に作ったアクションを共有し、ストリップだけを追加する
+        '''
+        trace = self.trace
+        sentence = self.load_lab(self.filepath, self.use_cache(context), trace)[1]
+        frame = context.scene.frame_current
+        offset = self.object_offset * context.scene.render.fps
+        shared: dict[str, Action] = {}
+        profiles = set()
+        for i, obj in enumerate(objects):
+            with context.temp_override(active_object=obj, object=obj):
+                with trace.stage("phoneme_check"):
+                    covering, profile = self.phoneme_check(context)
+                if self.overwrite and not self.incremental:
+                    with trace.stage("overwrite_preprocess"):
+                        self.overwrite_preprocess(context, name)
+                if not covering:
+                    self.report({'WARNING'}, f"{obj.name} には挿入しませんでした")
+                    continue
+                with trace.stage("visemes"):
+                    visemes = self.build_visemes(context, profile)
+                with trace.stage("create_track"):
+                    track = self.create_track(context)
+                profiles.add(visemes.digest())
+                if self.incremental:
+                    for fingerprint, action in self.owned_actions(context, name).items():
+                        shared.setdefault(fingerprint, action)
+                schedules = self.file_schedules(context, self.filepath, visemes, sentence)
+                self.insert_schedules(
+                    context, schedules, visemes, name, track, frame + offset * i, shared=shared)
+        trace.count("objects", len(objects))
+        self.report(
+            {'INFO'}, f"{len(objects)} 個のオブジェクトに挿入しました（口形素の対応 {len(profiles)} 種類）")
+
+
+class IMPLAB_OT_BATCH_INSERT(ImplabInsertBase, Operator, ImportHelper):
+    '''
+    複数の.labファイルを並べて挿入
+    ファイルの読み込みはスレッドプールで先読みし、
+    メインスレッドでアクションの生成と挿入を行う
+    '''
+    bl_idname = "importlab.batch_insert"
+    bl_label = "一括挿入"
+    bl_description = "選択した.labファイル（未選択ならフォルダ内の全て）を並べて発音モーションを挿入する"
+    bl_options = {"REGISTER", "UNDO", "BLOCKING"}
 
-        sentence = lab.lab_words(self.filepath).split()
+    filename_ext = ".lab"
+    filter_glob: StringProperty(
+        default=";".join(f"*{ext}" for ext in lab.extensions()), options={'HIDDEN'}, maxlen=255)
+    files: CollectionProperty(
+        type=OperatorFileListElement, options={'HIDDEN', 'SKIP_SAVE'})
+    directory: StringProperty(subtype='DIR_PATH', options={'HIDDEN'})
+    order: EnumProperty(
+        name="配置",
+        items=(('FILENAME', "ファイル名順", "ファイル名順に隙間なく並べる"),
+               ('GAP', "一定間隔", "ファイル名順に一定の間隔を空けて並べる"),
+               ('CUESHEET', "キューシート", "CSVファイルで指定したフレームに配置する")),
+        default='FILENAME')
+    gap: FloatProperty(
+        name="間隔", description="ファイル同士の間隔（秒）", default=0.5, min=0.0)
+    cue_sheet: StringProperty(
+        name="キューシート", description="「ファイル名,開始フレーム」の行からなるCSVファイル", subtype='FILE_PATH')
 
-        covering, phoneme_dict = self.phoneme_check(context)
-        if self.overwrite:
-            self.overwrite_preprocess(context)
+    def execute(self, context):
+        print("IMPLAB : Batch Insert Start")
+        trace = self.trace = instrument.trace("batch")
+        self.import_id = new_import_id()
+        paths = self.lab_files()
+        if not paths:
+            self.report({'ERROR'}, "挿入する.labファイルがありません")
+            return {"CANCELLED"}
+        if self.order == 'CUESHEET':
+            if not (cue := self.read_cue_sheet()):
+                return {"CANCELLED"}
+            paths = [p for p in paths if self.cue_name(p) in cue]
+
+        with trace.stage("phoneme_check"):
+            covering, profile = self.phoneme_check(context)
         if not covering:
             return {"FINISHED"}
-        match self.target:
-            case 'ARMATURE':
-                actions = self.generate_rig_action(
-                    context, covering, sentence, phoneme_dict)
-            case 'MESH':
-                actions = self.generate_shapekey_action(
-                    context, covering, sentence, phoneme_dict)
-        track = self.create_track(context)
-        self.insert_action_in_track(context, sentence, actions, track)
 
+        fps = context.scene.render.fps
+        gap = self.gap if self.order == 'GAP' else 0.0
+        frame = context.scene.frame_current
+        use_cache = self.use_cache(context)
+        with trace.stage("visemes"):
+            visemes = self.build_visemes(context, profile)
+        with trace.stage("create_track"):
+            track = self.create_track(context)
+        trace.count("files", len(paths))
+
+        def load(path):
+            # 読み込めないファイルは例外を返し、そのファイルだけ飛ばす
+            try:
+                return self.load_lab(path, use_cache, trace)
+            except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+                return e
+
+        # 読み込みと解析はワーカースレッドで先に進め、bpyの操作はメインスレッドで行う
+        with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+            loaded = executor.map(load, paths)
+            # parse, splitはワーカースレッドでの時間の合計なのでトレースのworker_stagesに入る。読み込み待ちの時間はwait_loadに入る
+            for path, result in zip(paths, trace.iterate("wait_load", loaded)):
+                if isinstance(result, Exception):
+                    self.report({'WARNING'}, f"読み込めないファイルを飛ばしました: {path} ({result})")
+                    trace.count("skipped_files")
+                    continue
+                words, sentence = result
+                name = bpy.path.display_name_from_filepath(path)
+                self.loudness = self.load_loudness(path)
+                if self.overwrite and not self.incremental:
+                    with trace.stage("overwrite_preprocess"):
+                        self.overwrite_preprocess(context, name)
+                if self.order == 'CUESHEET':
+                    frame = cue[self.cue_name(path)]
+                # 並べる位置に.labの長さが要るので、ディスクキャッシュがあっても読み込みは省かない
+                schedules = self.file_schedules(context, path, visemes, sentence)
+                self.insert_schedules(
+                    context, schedules, visemes, name, track, frame)
+                if len(words.table):
+                    frame += (words.table.timingE[-1] + gap) * fps
+
+        self.report_decimation()
+        self.report_trace(context)
         return {"FINISHED"}
 
-    def phoneme_check(self, context: Context) -> tuple[str, dict]:
-        props = context.active_object.data.implab_props
-        vlist = props.vowel_list
-        clist = props.consonants_list
-        obj = context.active_object
+    def lab_files(self) -> list[str]:
+        names = [f.name for f in self.files if f.name]
+        if not names:
+            names = [n for n in os.listdir(self.directory)
+                     if os.path.splitext(n)[1].lower() in lab.extensions()
+                     and lab.readable(os.path.join(self.directory, n))]
+        return [os.path.join(self.directory, n) for n in sorted(names)]
+
+    @staticmethod
+    def cue_name(path: str) -> str:
+        return os.path.splitext(os.path.basename(path))[0]
+
+    def read_cue_sheet(self) -> dict[str, float]:
+        cue = {}
+        try:
+            with open(bpy.path.abspath(self.cue_sheet), newline='', encoding='utf-8-sig') as f:
+                for row in csv.reader(f):
+                    if len(row) < 2:
+                        continue
+                    try:
+                        cue[self.cue_name(row[0].strip())] = float(row[1])
+                    except ValueError:  # ヘッダー行など
+                        continue
+        except OSError as e:
+            self.report({'ERROR'}, f"キューシートを読み込めません: {e}")
+            return {}
+        if not cue:
+            self.report({'ERROR'}, "キューシートに有効な行がありません")
+        return cue
+
+
+class IMPLAB_OT_INSERT_MODAL(ImplabInsertBase, Operator, ImportHelper):
+    '''
+    挿入をタイマーで少しずつ進める（生成中もBlenderを操作できる）
+    生成したアクションは作業用のトラックに挿入し、終わったら"LAB Speech"トラックへ移す
+    Escで中止すると作業用のトラックと生成したアクションを削除し、挿入前の状態に戻す
+    '''
+    bl_idname = "importlab.insert_modal"
+    bl_label = "バックグラウンドで挿入"
+    bl_description = "Blenderを止めずに発音モーションを少しずつ挿入する。Escで中止"
+    bl_options = {"REGISTER", "UNDO"}
 
-        # 音素スロットが一意か確認
-        slots = [p for p in vlist] + [p for p in clist]
-        unique = [v for i, v in enumerate(slots) if v.viseme in [
-            l.viseme for l in slots[i+1:]]]
-        if unique:
-            for u in unique:
-                self.report({'ERROR'}, f"一意ではない音素: {u.viseme}")
-            return None, None
+    STAGING = "LAB Speech (挿入中)"
 
-        # 音素辞書作成
-        phoneme_dict = {v.viseme: v.pose for v in slots}
+    filename_ext = ".lab"
+    filter_glob: StringProperty(
+        default=";".join(f"*{ext}" for ext in lab.extensions()), options={'HIDDEN'}, maxlen=255)
+    audio_path: StringProperty(
+        name="音声ファイル", description="音量で強弱を付けるWAVファイル。空欄なら.labと同じ名前の.wav", subtype='FILE_PATH', default="")
+    time_budget: FloatProperty(
+        name="1回の処理時間（秒）", description="タイマー1回ごとに生成、挿入に使う時間の目安", default=0.05, min=0.005, max=1.0)
 
-        if phoneme_dict['a'] != None and phoneme_dict['N'] != None:
-            ret = 'OPEN_SHUT'
-        else:
-            self.report({'ERROR'}, "最低限のアクションが指定されていません: 'a' , 'N'")
-            return None, None
-        if len(vlist) >= 3 and None not in [v.pose for v in vlist]:
-            ret = 'VOWEL'
-        if len(clist) > 0 and None not in [v.pose for v in clist]:
-            ret += '_CONSONANTS'
-        return ret, phoneme_dict
-
-    def overwrite_preprocess(self, context: Context):
-        if self.target == 'ARMATURE':
-            data = context.active_object.animation_data
-        elif self.target == 'MESH':
-            data = context.active_object.data.shape_keys.animation_data
-        if data:
-            name = bpy.path.display_name_from_filepath(self.filepath)
-            if (track := data.nla_tracks.find("LAB Speech")) == -1:
-                return
-            strips = data.nla_tracks[track].strips
-            for strip in [s for s in strips if re.fullmatch(f"{name}(\.[0-9]+)?$", s.name)]:
-                action = strip.action
-                strips.remove(strip)
+    def execute(self, context):
+        print("IMPLAB : Modal Insert Start")
+        name = self.lab_name = bpy.path.display_name_from_filepath(self.filepath)
+        trace = self.trace = instrument.trace(name)
+        self.import_id = new_import_id()
+        self.loudness = self.load_loudness(self.filepath, self.audio_path)
+        self.obj = context.active_object
+        self.frame = context.scene.frame_current
+
+        with trace.stage("phoneme_check"):
+            covering, profile = self.phoneme_check(context)
+        if not covering:
+            return {"FINISHED"}
+        with trace.stage("visemes"):
+            self.visemes = self.build_visemes(context, profile)
+        self.schedules = self.file_schedules(context, self.filepath, self.visemes)
+        self.pending = self.schedules
+        if self.incremental:  # 既存のストリップは最後に差分更新するまで変えない
+            with trace.stage("incremental"):
+                _, owned = self.owned_strips(context, name)
+                rebuild = self.match_strips(self.schedules, owned, self.frame)[0]
+            self.pending = [self.schedules[i] for i in rebuild]
+
+        if speech_track(self.obj, self.STAGING):
+            self.report({'ERROR'}, f"{self.obj.name} には挿入中のトラックがあります")
+            return {"CANCELLED"}
+        self.staging = self.create_track(context, self.STAGING)
+        self.actions: list[Action] = []
+        self.done = 0
+
+        wm = context.window_manager
+        if context.window is None:  # バックグラウンド実行ではタイマーが来ないので一度に処理する
+            while self.done < len(self.pending):
+                self.step(context)
+            return self.finish(context)
+        self.timer = wm.event_timer_add(0.01, window=context.window)
+        wm.modal_handler_add(self)
+        wm.progress_begin(0, max(1, len(self.pending)))
+        return {"RUNNING_MODAL"}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.cancel(context)
+            self.report({'WARNING'}, "挿入を中止しました")
+            return {"CANCELLED"}
+        if event.type != 'TIMER' or event.timer != self.timer:
+            return {"PASS_THROUGH"}
+        try:
+            self.step(context)
+        except ReferenceError:  # 挿入中にオブジェクトやアクションが削除された
+            self.cancel(context)
+            self.report({'ERROR'}, "挿入先が削除されたため中止しました")
+            return {"CANCELLED"}
+        if self.done < len(self.pending):
+            context.window_manager.progress_update(self.done)
+            self.status(context, f"IMPLAB : {self.lab_name} {self.done} / {len(self.pending)} 文を挿入しました（Escで中止）")
+            return {"RUNNING_MODAL"}
+        self.end_modal(context)
+        return self.finish(context)
+
+    def step(self, context: Context):
+        # 時間の目安を超えるまで1文ずつ生成して作業用のトラックに挿入する（最低1文）
+        trace = self.trace
+        deadline = time.perf_counter() + self.time_budget
+        while self.done < len(self.pending) and time.perf_counter() < deadline:
+            sentence = self.pending[self.done]
+            with trace.stage("generate"):
+                action = self.generate_action(context, [sentence], self.visemes, self.lab_name)[0]
+            self.actions.append(action)
+            trace.count("actions")
+            with trace.stage("insert_action_in_track"):
+                self.insert_action_in_track(
+                    context, [sentence], [action], self.staging, self.frame)
+            self.done += 1
+
+    def finish(self, context: Context):
+        # 作業用のトラックを消し、既存のストリップを上書き（差分更新）してから"LAB Speech"に挿入する
+        trace = self.trace
+        self.remove_track(self.staging)
+        with context.temp_override(active_object=self.obj, object=self.obj):
+            if self.incremental:
+                with trace.stage("incremental"):
+                    self.incremental_update(context, self.schedules, self.frame, self.lab_name)
+                self.report(
+                    {'INFO'}, f"{len(self.schedules)} 文のうち {len(self.pending)} 文を作り直しました")
+            elif self.overwrite:
+                with trace.stage("overwrite_preprocess"):
+                    self.overwrite_preprocess(context, self.lab_name)
+            with trace.stage("create_track"):
+                track = self.create_track(context)
+            with trace.stage("insert_action_in_track"):
+                self.insert_action_in_track(
+                    context, self.pending, self.actions, track, self.frame)
+            self.report_decimation()
+            self.report_trace(context)
+        return {"FINISHED"}
+
+    def cancel(self, context: Context):
+        # 中止（Esc、ファイルの読み込みなど）。作ったストリップとアクションを削除する
+        self.end_modal(context)
+        try:
+            self.remove_track(self.staging)
+        except ReferenceError:
+            pass
+        for action in self.actions:
+            try:
                 bpy.data.actions.remove(action)
+            except ReferenceError:
+                pass
+        self.actions = []
 
-    def generate_rig_action(self, context: Context, covering: str, sentence: list[lab.lab_words], phoneme_dict: dict[str, Action]):
-        props = context.active_object.data.implab_props
-        obj = context.active_object
-        fps = 100 if self.use_scale else context.scene.render.fps
+    def end_modal(self, context: Context):
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+        self.status(context, None)
 
-        a = phoneme_dict['a']
-        N = phoneme_dict['N']
-
-        vlist = {v.viseme: v.pose if v.pose else a for v in props.vowel_list}
-        clist = {c.viseme: c.pose if c.pose else N for c in props.consonants_list}
-        src_list: dict[str, Action] = vlist | clist
-        actionname = bpy.path.display_name_from_filepath(self.filepath)
-
-        action_list = []
-        for s in sentence:
-            act: Action = bpy.data.actions.new(actionname)
-            # ファイル先頭の'pau'を'N'にする
-            if act.name == actionname and s.phoneme_list[0].phoneme == 'pau':
-                s.phoneme_list[0].phoneme = 'N'
-            for p in s.phoneme_list:
-                if p.phoneme not in src_list.keys():
-                    continue
-                phoneme = src_list[p.phoneme]
-                timing = (((p.timingB + p.timingE)/2)*fps,)
-
-                if p.length() > 0.1:  # 発音が長い場合、タイミングを2つ作る
-                    timing = ((p.timingB + 0.05) * fps,
-                              (p.timingE - 0.05) * fps)
-
-                for src_fcurve in phoneme.fcurves:  # 音素のFカーブをアクションに打ち込む
-                    index = src_fcurve.array_index
-                    fcurve = act.fcurves.find(
-                        src_fcurve.data_path, index=index)
-                    if not fcurve:
-                        fcurve = act.fcurves.new(
-                            src_fcurve.data_path, index=index, action_group=src_fcurve.group.name)
-                    for keyframe in src_fcurve.keyframe_points:
-                        for t in timing:  # 発音が長い場合、キーフレームを2つ打つ
-                            frame, value = keyframe.co
-                            fcurve.keyframe_points.insert(
-                                t, value, options={'FAST'})
-
-            for curve in act.fcurves:
-                curve.update()
-            act.use_fake_user = True
-            action_list.append(act)
-        return action_list
-
-    def generate_shapekey_action(self, context: Context, covering: str, sentence: list[lab.lab_words], phoneme_dict: dict[str, str]):
-        props = context.active_object.data.implab_props
-        obj = context.active_object
-        fps = 100 if self.use_scale else context.scene.render.fps
+    @staticmethod
+    def status(context: Context, text: str):
+        if context.workspace:
+            context.workspace.status_text_set(text)
 
-        a = phoneme_dict['a']
-        N = phoneme_dict['N']
-
-        keys = obj.data.shape_keys.key_blocks
-        vlist = {v.viseme: keys[v.pose]
-                 if v.pose else a for v in props.vowel_list}
-        clist = {c.viseme: keys[c.pose]
-                 if c.pose else N for c in props.consonants_list}
-        src_list: dict[str, ShapeKey] = vlist | clist
-        actionname = bpy.path.display_name_from_filepath(self.filepath)
-
-        action_list = []
-        for s in sentence:
-            act: Action = bpy.data.actions.new(actionname)
-            # ファイル先頭の'pau'を'N'にする
-            if act.name == actionname and s.phoneme_list[0].phoneme == 'pau':
-                s.phoneme_list[0].phoneme = 'N'
-            for p in s.phoneme_list:
-                if p.phoneme not in src_list.keys():
-                    continue
-                phoneme = src_list[p.phoneme]
-
-                # タイミング生成
-                timing = [((p.timingB - 0.05), 0.0)]
-                if p.length() > 0.1:  # 発音が長い場合、タイミングを2つ作る
-                    timing.extend([(p.timingB + 0.05, 1.0),
-                                  (p.timingE - 0.05, 1.0)])
-                else:
-                    timing.append(((p.timingB+p.timingE)/2, 1.0))
-                timing.append((p.timingE+0.05, 0.0))
-
-                # キーフレーム打ち込み
-                shapekeyname = f"key_blocks[\"{phoneme.name}\"].value"
-                if not (fcurve := act.fcurves.find(shapekeyname)):
-                    fcurve = act.fcurves.new(shapekeyname)
-                for t, v in timing:
-                    fcurve.keyframe_points.insert(
-                        t*fps, v, options={'FAST'})
-
-            for curve in act.fcurves:
-                curve.update()
-            act.use_fake_user = True
-            action_list.append(act)
-        return action_list
-
-    def create_track(self, context: Context):
+    @staticmethod
+    def remove_track(track):
+        cache.tracks.pop(track.as_pointer(), None)
+        track.id_data.animation_data.nla_tracks.remove(track)
+
+
+class IMPLAB_OT_LIVE(ImplabInsertBase, Operator, ImportHelper):
+    '''
+    ライブモード
+    キーフレームを打たず、フレームが変わるたびに口形素の値を直接書き込む
+    設定はオブジェクトのカスタムプロパティ implab_live に残し、ファイルを開いたときに作り直す
+    '''
+    bl_idname = "importlab.live"
+    bl_label = "ライブ"
+    bl_description = "キーフレームを打たずに、フレームに合わせて口形素の値を直接設定する（レイアウト、プレビズ向け）"
+    bl_options = {"REGISTER", "UNDO"}
+
+    filename_ext = ".lab"
+    filter_glob: StringProperty(
+        default=";".join(f"*{ext}" for ext in lab.extensions()), options={'HIDDEN'}, maxlen=255)
+    audio_path: StringProperty(
+        name="音声ファイル", description="音量で強弱を付けるWAVファイル。空欄なら.labと同じ名前の.wav", subtype='FILE_PATH', default="")
+
+    def execute(self, context):
         obj = context.active_object
+        self.trace = instrument.trace(bpy.path.display_name_from_filepath(self.filepath))
+        self.loudness = self.load_loudness(self.filepath, self.audio_path)
+        frame = context.scene.frame_current
+        stop_live(obj)  # 前のライブの値を元に戻してから
+        player = self.build_live(context, self.filepath, frame)
+        if player is None:
+            return {"CANCELLED"}
+        live.players[obj.name] = player
+        obj["implab_live"] = {
+            "filepath": self.filepath, "frame": frame, "target": self.target, "use_scale": self.use_scale,
+            "use_audio": self.use_audio, "audio_floor": self.audio_floor, "audio_path": self.audio_path,
+            "engine": self.engine, "blend_shape": self.blend_shape, "attack_time": self.attack_time,
+            "decay_time": self.decay_time, "rest": player.rest.tolist(),
+        }
+        apply_live(context.scene)
+        self.report({'INFO'}, f"{obj.name} : {len(player)} 文をライブで再生します")
+        self.report_trace(context)
+        return {"FINISHED"}
 
-        match obj.type:
-            case 'ARMATURE':
-                target = obj
-            case 'MESH':
-                target = obj.data.shape_keys
 
-        if not target.animation_data:
-            target.animation_data_create()
-        nla_tracks = target.animation_data.nla_tracks
+class live_loader(ImplabInsertBase):
+    '''
+    ファイルを開いたときに implab_live の設定からライブモードを作り直す
+    オペレーターの代わりに設定を持つ
+    '''
 
-        if (id := nla_tracks.find("LAB Speech")) != -1:
-            return nla_tracks[id]
-        else:
-            track = nla_tracks.new()
-            track.name = "LAB Speech"
-            return track
+    def __init__(self, settings: dict) -> None:
+        self.target = settings["target"]
+        self.use_scale = settings["use_scale"]
+        self.use_audio = settings["use_audio"]
+        self.audio_floor = settings["audio_floor"]
+        self.engine = settings.get("engine", 'KEYS')
+        self.blend_shape = settings.get("blend_shape", 'SMOOTH')
+        self.attack_time = settings.get("attack_time", 0.08)
+        self.decay_time = settings.get("decay_time", 0.12)
+        self.overwrite = False
+        self.incremental = False
+        self.decimate = False
+        self.decimate_tolerance = 0.0
+        self.output = 'SENTENCE'
+        self.chunk_minutes = 0.0
+        self.trace = instrument.trace("live")
+        self.loudness = self.load_loudness(settings["filepath"], settings["audio_path"])
+
+    def report(self, level, message):
+        print(f"IMPLAB : {message}")
+
+
+@persistent
+def restore_live(scene, depsgraph=None):
+    live.players.clear()
+    for obj in bpy.data.objects:
+        if (settings := obj.get("implab_live")) is None:
+            continue
+        settings = settings.to_dict()
+        loader = live_loader(settings)
+        try:
+            with bpy.context.temp_override(active_object=obj, object=obj):
+                player = loader.build_live(
+                    bpy.context, bpy.path.abspath(settings["filepath"]), settings["frame"], settings["rest"])
+        except (OSError, ValueError) as e:
+            print(f"IMPLAB : {obj.name} のライブモードを作り直せません ({e})")
+            continue
+        if player is not None:
+            live.players[obj.name] = player
+
+
+class IMPLAB_OT_LIVE_BAKE(Operator):
+    bl_idname = "importlab.live_bake"
+    bl_label = "ベイク"
+    bl_description = "ライブモードをやめて、同じ.labと挿入フレームでアクションとNLAストリップを作る"
+    bl_options = {"REGISTER", "UNDO"}
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and "implab_live" in context.active_object
 
-    def insert_action_in_track(self, context: Context, sentence: list[lab.lab_words], action_list: list[Action], track):
+    def execute(self, context):
         obj = context.active_object
-        current_frame = context.scene.frame_current
+        settings = obj["implab_live"].to_dict()
+        stop_live(obj)
+        scene = context.scene
+        frame = scene.frame_current
+        try:
+            scene.frame_current = int(settings["frame"])
+            result = bpy.ops.importlab.insert(
+                'EXEC_DEFAULT', filepath=settings["filepath"], target=settings["target"],
+                use_scale=settings["use_scale"], use_audio=settings["use_audio"],
+                audio_floor=settings["audio_floor"], audio_path=settings["audio_path"],
+                **{k: settings[k] for k in ("engine", "blend_shape", "attack_time", "decay_time") if k in settings})
+        finally:
+            scene.frame_current = frame
+        return {"FINISHED"} if 'FINISHED' in result else {"CANCELLED"}
+
+
+class IMPLAB_OT_LIVE_CLEAR(Operator):
+    bl_idname = "importlab.live_clear"
+    bl_label = "ライブを解除"
+    bl_description = "ライブモードをやめて、口形素の値を元に戻す"
+    bl_options = {"REGISTER", "UNDO"}
 
-        for words, action in zip(sentence, action_list):
-            p = words.phoneme_list[1] if words.phoneme_list[0].phoneme == 'pau' else words.phoneme_list[0]
-            insert_frame = (p.timingB+0.05 if p.length() > 0.1 else (p.timingB+p.timingE)/2) * \
-                context.scene.render.fps + current_frame
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and "implab_live" in context.active_object
 
-            strip = track.strips.new(action.name, int(insert_frame), action)
-            strip.extrapolation = 'NOTHING'
-            if self.use_scale:
-                strip.scale = context.scene.render.fps / 100.0
+    def execute(self, context):
+        stop_live(context.active_object)
+        return {"FINISHED"}
 
-        # for index in range(len(action_list[1:])):
-        #     bpy.ops.nla.transition_add()
+
+class IMPLAB_OT_CLEAR_DISK_CACHE(Operator):
+    bl_idname = "importlab.clear_disk_cache"
+    bl_label = "削除"
+    bl_description = "ディスクキャッシュのファイルを全て削除する"
+    bl_options = {"REGISTER"}
+
+    def execute(self, context):
+        prefs = context.preferences.addons[__package__].preferences
+        cache.disk.configure(bpy.path.abspath(prefs.disk_cache_dir), prefs.disk_cache_limit << 20)
+        self.report({'INFO'}, f"{cache.disk.clear()} 個のキャッシュを削除しました")
+        return {"FINISHED"}
+
+
+def import_rows(obj) -> list[tuple[str, str, int, float, float]]:
+    # "LAB Speech"トラックの挿入ごとの(読み込み元, 読み込みID, ストリップの数, 開始, 終了フレーム)
+    if (track := speech_track(obj)) is None:
+        return []
+    rows = []
+    by_name = {s.name: s for s in track.strips}
+    for (source, import_id), names in track_index(track).imports().items():
+        strips = [s for n in names if (s := by_name.get(n)) is not None]
+        if strips:
+            rows.append((source, import_id, len(strips),
+                         min(s.frame_start for s in strips), max(s.frame_end for s in strips)))
+    return sorted(rows, key=lambda r: (r[3], r[0]))
+
+
+class IMPLAB_OT_DELETE_IMPORT(Operator):
+    bl_idname = "importlab.delete_import"
+    bl_label = "挿入を削除"
+    bl_description = "指定した.labファイルから挿入したストリップと、他で使っていないアクションを削除する"
+    bl_options = {"REGISTER", "UNDO"}
+
+    source: StringProperty(name="読み込み元", description=".labファイルの名前（拡張子なし）")
+    import_id: StringProperty(name="挿入ID", description="この挿入のストリップだけを削除する。空欄なら読み込み元の全て")
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and context.active_object.type in {'ARMATURE', 'MESH'}
+
+    def execute(self, context):
+        if (track := speech_track(context.active_object)) is None:
+            self.report({'WARNING'}, "\"LAB Speech\"トラックがありません")
+            return {"CANCELLED"}
+        strips = source_strips(track, self.source, self.import_id or None)
+        for strip in strips:
+            remove_strip(track, strip)
+        self.report({'INFO'}, f"{self.source} : {len(strips)} 個のストリップを削除しました")
+        return {"FINISHED"}
+
+
+class IMPLAB_OT_LIST_IMPORTS(Operator):
+    bl_idname = "importlab.list_imports"
+    bl_label = "挿入の一覧"
+    bl_description = "\"LAB Speech\"トラックに挿入した.labファイルごとのストリップの数と範囲を表示する"
+    bl_options = {"REGISTER"}
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and context.active_object.type in {'ARMATURE', 'MESH'}
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_popup(self, width=480)
+
+    def draw(self, context):
+        layout = self.layout
+        if not (rows := import_rows(context.active_object)):
+            layout.label(text="挿入した.labファイルはありません")
+            return
+        for source, import_id, count, start, end in rows:
+            row = layout.row()
+            row.label(text=source, icon='SOUND')
+            row.label(text=import_id or "（以前のバージョン）")
+            row.label(text=f"{count} 個  {start:g} - {end:g}")
+            op = row.operator(IMPLAB_OT_DELETE_IMPORT.bl_idname, text="", icon='X')
+            op.source = source
+            op.import_id = import_id
+
+    def execute(self, context):
+        rows = import_rows(context.active_object)
+        for source, import_id, count, start, end in rows:
+            self.report({'INFO'}, f"{source} [{import_id or '-'}] : {count} 個 {start:g} - {end:g}")
+        if not rows:
+            self.report({'INFO'}, "挿入した.labファイルはありません")
+        return {"FINISHED"}
 
 
 class IMPLAB_OT_SET_CURRENT_FRAME(Operator):
@@ -354,6 +1494,7 @@ class IMPLAB_OT_SetPhonemeList(Operator):
             if cl[p] not in [a.viseme for a in props.consonants_list]:
                 a = props.consonants_list.add()
                 a.viseme = cl[p]
+        invalidate_profile(props, context)
         return {"FINISHED"}
 
 
@@ -368,6 +1509,7 @@ class IMPLAB_OT_NewVowel(Operator):
     def execute(self, context):
         props = context.active_object.data.implab_props
         v = props.vowel_list.add()
+        invalidate_profile(props, context)
         return {"FINISHED"}
 
 
@@ -385,6 +1527,7 @@ class IMPLAB_OT_DeleteVowel(Operator):
         props.vowel_list.remove(index)
         props.vowel_active_index = min(
             max(0, index-1), len(props.vowel_list)-1)
+        invalidate_profile(props, context)
         return {"FINISHED"}
 
 
@@ -412,6 +1555,7 @@ class IMPLAB_OT_MoveVowel(Operator):
                 props.vowel_list.move(
                     props.vowel_active_index+1, props.vowel_active_index)
                 context.active_object.data.implab_props.vowel_active_index += 1
+        invalidate_profile(props, context)
         return {"FINISHED"}
 
 
@@ -426,6 +1570,7 @@ class IMPLAB_OT_NewConsonants(Operator):
     def execute(self, context):
         props = context.active_object.data.implab_props
         v = props.consonants_list.add()
+        invalidate_profile(props, context)
         return {"FINISHED"}
 
 
@@ -443,6 +1588,7 @@ class IMPLAB_OT_DeleteConsonants(Operator):
         props.consonants_list.remove(index)
         props.consonants_active_index = min(
             max(0, index-1), len(props.consonants_list)-1)
+        invalidate_profile(props, context)
         return {"FINISHED"}
 
 
@@ -470,9 +1616,31 @@ class IMPLAB_OT_MoveConsonants(Operator):
                 props.consonants_list.move(
                     props.consonants_active_index+1, props.consonants_active_index)
                 context.active_object.data.implab_props.consonants_active_index += 1
+        invalidate_profile(props, context)
         return {"FINISHED"}
 
 
+def draw_profile(layout, data):
+    # 口形素スロットの検証結果を表示する
+    profile = get_profile(data)
+    for error in profile.errors:
+        layout.label(text=error, icon='ERROR')
+    if profile.coverage:
+        layout.label(text=f"対応 : {profile.coverage}", icon='CHECKMARK')
+
+
+def draw_live(layout, obj, target: str):
+    # ライブモードでなければ開始ボタン、ライブモードならファイル名とベイク、解除のボタン
+    if (settings := obj.get("implab_live")) is None:
+        layout.operator(IMPLAB_OT_LIVE.bl_idname).target = target
+        return
+    box = layout.box()
+    box.label(text=f"ライブ : {bpy.path.basename(settings['filepath'])}", icon='PLAY')
+    row = box.row(align=True)
+    row.operator(IMPLAB_OT_LIVE_BAKE.bl_idname)
+    row.operator(IMPLAB_OT_LIVE_CLEAR.bl_idname)
+
+
 class IMPLAB_PT_ImplabPanel(Panel):
     bl_space_type = 'PROPERTIES'
     bl_region_type = 'WINDOW'
@@ -498,7 +1666,12 @@ class IMPLAB_PT_ImplabPanel(Panel):
         # size = row.operator(
         #     IMPLAB_OT_SET_CURRENT_FRAME.bl_idname, text="", icon="TIME")
         layout.operator(IMPLAB_OT_INSERT.bl_idname).target = 'ARMATURE'
+        layout.operator(IMPLAB_OT_BATCH_INSERT.bl_idname).target = 'ARMATURE'
+        layout.operator(IMPLAB_OT_INSERT_MODAL.bl_idname).target = 'ARMATURE'
+        draw_live(layout, context.active_object, 'ARMATURE')
+        layout.operator(IMPLAB_OT_LIST_IMPORTS.bl_idname)
         layout.operator(IMPLAB_OT_SetPhonemeList.bl_idname)
+        draw_profile(layout, context.active_object.data)
 
 
 class IMPLAB_UL_PhonemeList(UIList):
@@ -605,7 +1778,12 @@ class IMPLAB_PT_ImplabPanelMesh(Panel):
 
         layout.label(text="発音モーション挿入")
         layout.operator(IMPLAB_OT_INSERT.bl_idname).target = 'MESH'
+        layout.operator(IMPLAB_OT_BATCH_INSERT.bl_idname).target = 'MESH'
+        layout.operator(IMPLAB_OT_INSERT_MODAL.bl_idname).target = 'MESH'
+        draw_live(layout, context.active_object, 'MESH')
+        layout.operator(IMPLAB_OT_LIST_IMPORTS.bl_idname)
         layout.operator(IMPLAB_OT_SetPhonemeList.bl_idname)
+        draw_profile(layout, context.active_object.data)
 
 
 class IMPLAB_PT_vowelMesh(Panel):
@@ -669,6 +1847,14 @@ classes = [
     ImplabShapekeyPointer,
     ImplabMeshPropertyGroup,
     IMPLAB_OT_INSERT,
+    IMPLAB_OT_BATCH_INSERT,
+    IMPLAB_OT_INSERT_MODAL,
+    IMPLAB_OT_LIVE,
+    IMPLAB_OT_LIVE_BAKE,
+    IMPLAB_OT_LIVE_CLEAR,
+    IMPLAB_OT_CLEAR_DISK_CACHE,
+    IMPLAB_OT_DELETE_IMPORT,
+    IMPLAB_OT_LIST_IMPORTS,
     IMPLAB_OT_SET_CURRENT_FRAME,
     IMPLAB_OT_SetPhonemeList,
     IMPLAB_OT_NewVowel,
@@ -697,12 +1883,34 @@ def register():
         type=ImplabPropertyGroup, override={"LIBRARY_OVERRIDABLE"})
     bpy.types.Mesh.implab_props = bpy.props.PointerProperty(
         type=ImplabMeshPropertyGroup, override={"LIBRARY_OVERRIDABLE"})
+    bpy.app.handlers.depsgraph_update_post.append(invalidate_pose_templates)
+    bpy.app.handlers.load_post.append(invalidate_pose_templates)
+    bpy.app.handlers.undo_post.append(invalidate_pose_templates)
+    bpy.app.handlers.redo_post.append(invalidate_pose_templates)
+    for handler in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        handler.append(invalidate_profiles)
+    bpy.app.handlers.frame_change_pre.append(apply_live)
+    bpy.app.handlers.load_post.append(restore_live)
+    for handler in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        handler.append(invalidate_strip_indexes)
 
     print("アドオン\"Inport Lab\"が有効化されました。")
 
 
 # アドオン無効化時の処理
 def unregister():
+    bpy.app.handlers.depsgraph_update_post.remove(invalidate_pose_templates)
+    bpy.app.handlers.load_post.remove(invalidate_pose_templates)
+    bpy.app.handlers.undo_post.remove(invalidate_pose_templates)
+    bpy.app.handlers.redo_post.remove(invalidate_pose_templates)
+    for handler in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        handler.remove(invalidate_profiles)
+    bpy.app.handlers.frame_change_pre.remove(apply_live)
+    bpy.app.handlers.load_post.remove(restore_live)
+    for handler in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        handler.remove(invalidate_strip_indexes)
+    cache.tracks.clear()
+    live.players.clear()
     for c in classes:
         bpy.utils.unregister_class(c)
     del bpy.types.Armature.implab_props
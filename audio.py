@@ -0,0 +1,99 @@
+import hashlib
+import wave
+
+import numpy as np
+
+# WAVファイルの音量の包絡線
+# ファイル全体は読み込まず、一定量ずつ読んで一定間隔ごとの二乗平均だけを残す
+
+HOP = 0.01  # 音量を求める間隔（秒）
+CHUNK = 10.0  # 一度に読み込む長さ（秒）
+
+
+def _samples(data: bytes, width: int, channels: int) -> np.ndarray:
+    # PCMのバイト列をモノラルの[-1, 1]の配列にする
+    match width:
+        case 1:
+            x = np.frombuffer(data, dtype=np.uint8).astype(np.float64) - 128.0
+            scale = 128.0
+        case 2:
+            x = np.frombuffer(data, dtype='<i2').astype(np.float64)
+            scale = 32768.0
+        case 3:
+            b = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+            v = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+            x = np.where(v & 0x800000, v - 0x1000000, v).astype(np.float64)
+            scale = 8388608.0
+        case 4:
+            x = np.frombuffer(data, dtype='<i4').astype(np.float64)
+            scale = 2147483648.0
+        case _:
+            raise wave.Error(f"対応していないサンプル幅: {width}")
+    return x.reshape(-1, channels).mean(axis=1) / scale
+
+
+class envelope:
+    '''
+    一定間隔ごとの音量（二乗平均）
+    power : 間隔ごとの二乗平均
+    hop : 間隔（秒）
+    floor : 最も小さい音のときの係数
+    '''
+
+    def __init__(self, power: np.ndarray, hop: float = HOP, floor: float = 0.3) -> None:
+        self.power = np.asarray(power, dtype=np.float64)
+        self.hop = hop
+        self.floor = floor
+        self._cumsum = np.r_[0.0, np.cumsum(self.power)]
+        # 無音を除いた区間の95パーセンタイルを最大の音量とする
+        voiced = self.power[self.power > self.power.max(initial=0.0) * 1e-4]
+        self.reference = float(np.sqrt(np.percentile(voiced, 95))) if len(voiced) else 0.0
+
+    def __len__(self) -> int:
+        return len(self.power)
+
+    @classmethod
+    def from_wav(cls, filepath: str, hop: float = HOP, floor: float = 0.3):
+        with wave.open(filepath, 'rb') as w:
+            rate = w.getframerate()
+            width = w.getsampwidth()
+            channels = w.getnchannels()
+            hop_frames = max(1, round(rate * hop))
+            chunk = hop_frames * max(1, int(CHUNK / hop))
+            blocks = []
+            rest = np.empty(0)
+            while data := w.readframes(chunk):
+                x = np.concatenate([rest, _samples(data, width, channels)])
+                n = len(x) // hop_frames * hop_frames
+                blocks.append(np.square(x[:n]).reshape(-1, hop_frames).mean(axis=1))
+                rest = x[n:]
+            if len(rest):
+                blocks.append([np.square(rest).mean()])
+        power = np.concatenate(blocks) if blocks else np.empty(0)
+        return cls(power, hop_frames / rate, floor)
+
+    def digest(self) -> str:
+        # 包絡線と設定のハッシュ（キャッシュのキーに使う）
+        h = hashlib.blake2b(self.power.tobytes(), digest_size=16)
+        h.update(np.array([self.hop, self.floor], dtype=np.float64).tobytes())
+        return h.hexdigest()
+
+    def rms(self, begin: np.ndarray, end: np.ndarray) -> np.ndarray:
+        '''
+        区間（秒）ごとの二乗平均平方根。音声の範囲外は0
+        '''
+        b = np.clip(np.floor(np.asarray(begin) / self.hop), 0, len(self)).astype(np.int64)
+        e = np.clip(np.ceil(np.asarray(end) / self.hop), 0, len(self)).astype(np.int64)
+        e = np.maximum(e, np.minimum(b + 1, len(self)))
+        count = e - b
+        total = self._cumsum[e] - self._cumsum[b]
+        return np.sqrt(np.divide(total, count, out=np.zeros(len(count)), where=count > 0))
+
+    def gain(self, begin: np.ndarray, end: np.ndarray) -> np.ndarray:
+        '''
+        区間ごとのキーの値に掛ける係数 (floor～1)
+        '''
+        if self.reference <= 0.0:
+            return np.ones(len(begin))
+        level = np.clip(self.rms(begin, end) / self.reference, 0.0, 1.0)
+        return self.floor + (1.0 - self.floor) * level
@@ -0,0 +1,300 @@
+'''
+ベンチマーク用のbpyの代わり
+アクション、Fカーブ、キーフレーム、NLAトラックのうちアドオンが使う最小限のAPIをPythonで再現し、
+呼び出し回数をcallsに数える。Blenderの内部の処理時間は再現しないので、
+計測できるのはアドオン側の処理とAPIの呼び出し回数だけ
+
+install()でsys.modulesに登録してからアドオンを読み込む
+'''
+import os
+import sys
+import tempfile
+import types
+from collections import Counter
+
+import numpy as np
+
+calls: Counter = Counter()
+
+
+def _call(name: str):
+    calls[name] += 1
+
+
+class ID:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._props = {}
+
+    @property
+    def name_full(self) -> str:
+        return self.name
+
+    def __getitem__(self, key):
+        return self._props[key]
+
+    def __setitem__(self, key, value):
+        self._props[key] = value
+
+    def __contains__(self, key) -> bool:
+        return key in self._props
+
+    def get(self, key, default=None):
+        return self._props.get(key, default)
+
+    def as_pointer(self) -> int:
+        return id(self)
+
+
+class Keyframe:
+    def __init__(self, points: 'KeyframePoints', index: int) -> None:
+        self.co = tuple(points.co[index])
+        self.interpolation = int(points.interpolation[index])
+
+
+class KeyframePoints:
+    def __init__(self) -> None:
+        self.co = np.zeros((0, 2), dtype=np.float32)
+        self.interpolation = np.zeros(0, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.co)
+
+    def __bool__(self) -> bool:
+        return len(self.co) > 0
+
+    def __getitem__(self, index: int) -> Keyframe:
+        return Keyframe(self, index)
+
+    def add(self, count: int):
+        _call("keyframe_points.add")
+        self.co = np.concatenate([self.co, np.zeros((count, 2), dtype=np.float32)])
+        self.interpolation = np.concatenate([self.interpolation, np.full(count, 2, dtype=np.int32)])
+
+    def insert(self, frame: float, value: float, options=None):
+        # 同じフレームのキーは値を上書きする
+        _call("keyframe_points.insert")
+        i = int(np.searchsorted(self.co[:, 0], frame))
+        if i < len(self.co) and self.co[i, 0] == frame:
+            self.co[i, 1] = value
+            return
+        self.co = np.insert(self.co, i, (frame, value), axis=0)
+        self.interpolation = np.insert(self.interpolation, i, 2)
+
+    def foreach_get(self, attr: str, seq):
+        _call("keyframe_points.foreach_get")
+        seq[:] = getattr(self, attr).ravel()
+
+    def foreach_set(self, attr: str, seq):
+        _call("keyframe_points.foreach_set")
+        getattr(self, attr).reshape(-1)[:] = np.asarray(seq).ravel()
+
+
+class FCurve:
+    def __init__(self, data_path: str, index: int = 0, group: str = '') -> None:
+        self.data_path = data_path
+        self.array_index = index
+        self.group = types.SimpleNamespace(name=group) if group else None
+        self.keyframe_points = KeyframePoints()
+
+    def update(self):
+        _call("fcurve.update")
+        points = self.keyframe_points
+        order = np.argsort(points.co[:, 0], kind='stable')
+        points.co = points.co[order]
+        points.interpolation = points.interpolation[order]
+
+
+class FCurves(list):
+    def new(self, data_path: str, index: int = 0, action_group: str = '') -> FCurve:
+        _call("fcurves.new")
+        fcurve = FCurve(data_path, index, action_group)
+        self.append(fcurve)
+        return fcurve
+
+
+class PoseMarkers(list):
+    def new(self, name: str):
+        _call("pose_markers.new")
+        marker = types.SimpleNamespace(name=name, frame=0)
+        self.append(marker)
+        return marker
+
+
+class Action(ID):
+    def __init__(self, name: str) -> None:
+        super().__init__(name)
+        self.fcurves = FCurves()
+        self.pose_markers = PoseMarkers()
+        self.use_fake_user = False
+        self.strip_users = 0
+
+    @property
+    def users(self) -> int:
+        return self.strip_users + int(self.use_fake_user)
+
+    @property
+    def frame_range(self) -> tuple[float, float]:
+        frames = [f.keyframe_points.co[:, 0] for f in self.fcurves if f.keyframe_points]
+        if not frames:
+            return 0.0, 1.0
+        frames = np.concatenate(frames)
+        return float(frames.min()), float(frames.max())
+
+
+class BlendDataActions(list):
+    def __init__(self) -> None:
+        super().__init__()
+        self._names: Counter = Counter()
+
+    def new(self, name: str) -> Action:
+        # 同じ名前には".001"のような番号を付ける
+        _call("actions.new")
+        n = self._names[name]
+        self._names[name] += 1
+        action = Action(name if n == 0 else f"{name}.{n:03d}")
+        self.append(action)
+        return action
+
+    def remove(self, action: Action):
+        _call("actions.remove")
+        list.remove(self, action)
+
+    def clear(self):
+        super().clear()
+        self._names.clear()
+
+
+class NlaStrip(ID):
+    def __init__(self, name: str, start: int, action: Action) -> None:
+        super().__init__(name)
+        self.action = action
+        self.action_frame_start, self.action_frame_end = action.frame_range
+        self.frame_start = float(start)
+        self.frame_end = self.frame_start + self.action_frame_end - self.action_frame_start
+        self.scale = 1.0
+        self.extrapolation = 'HOLD'
+
+
+class NlaStrips(list):
+    def get(self, name: str, default=None):
+        return next((strip for strip in self if strip.name == name), default)
+
+    def new(self, name: str, start: int, action: Action) -> NlaStrip:
+        _call("strips.new")
+        strip = NlaStrip(name, start, action)
+        action.strip_users += 1
+        self.append(strip)
+        return strip
+
+    def remove(self, strip: NlaStrip):
+        _call("strips.remove")
+        list.remove(self, strip)
+        if strip.action:
+            strip.action.strip_users -= 1
+
+
+class NlaTrack(ID):
+    def __init__(self, owner=None) -> None:
+        super().__init__("NlaTrack")
+        self.id_data = owner
+        self.strips = NlaStrips()
+
+
+class NlaTracks(list):
+    def __init__(self, owner=None) -> None:
+        super().__init__()
+        self.owner = owner
+
+    def new(self) -> NlaTrack:
+        _call("nla_tracks.new")
+        track = NlaTrack(self.owner)
+        self.append(track)
+        return track
+
+    def find(self, name: str) -> int:
+        return next((i for i, track in enumerate(self) if track.name == name), -1)
+
+    def remove(self, track: NlaTrack):
+        _call("nla_tracks.remove")
+        for strip in list(track.strips):
+            track.strips.remove(strip)
+        list.remove(self, track)
+
+
+class AnimData:
+    def __init__(self, owner=None) -> None:
+        self.nla_tracks = NlaTracks(owner)
+        self.action = None
+
+
+class AnimatedID(ID):
+    # オブジェクトやシェイプキー（Key）のようにアニメーションを持てるもの
+    def __init__(self, name: str) -> None:
+        super().__init__(name)
+        self.animation_data = None
+
+    def animation_data_create(self) -> AnimData:
+        self.animation_data = AnimData(self)
+        return self.animation_data
+
+
+def clear_actions():
+    # 呼び出し回数は残す
+    sys.modules["bpy"].data.actions.clear()
+
+
+def _module(name: str, **attrs) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+
+def _property(*args, **kwargs):
+    return (args, kwargs)
+
+
+def install() -> types.ModuleType:
+    '''
+    bpy, bpy_extrasの代わりをsys.modulesに登録してbpyを返す
+    '''
+    if (bpy := sys.modules.get("bpy")) is not None and getattr(bpy, "__fake__", False):
+        return bpy
+
+    class Operator:
+        def report(self, level, message):
+            print(f"{next(iter(level))} : {message}")
+
+    interpolation = types.SimpleNamespace(enum_items={
+        name: types.SimpleNamespace(value=i) for i, name in enumerate(('CONSTANT', 'LINEAR', 'BEZIER'))})
+    bl_rna = types.SimpleNamespace(properties={'interpolation': interpolation})
+
+    props = ("BoolProperty", "IntProperty", "FloatProperty", "StringProperty", "EnumProperty",
+             "PointerProperty", "CollectionProperty", "BoolVectorProperty", "IntVectorProperty",
+             "FloatVectorProperty")
+    bpy_types = _module(
+        "bpy.types", Operator=Operator, Action=Action, FCurve=FCurve, ID=ID,
+        Keyframe=types.SimpleNamespace(bl_rna=bl_rna),
+        **{name: type(name, (), {}) for name in (
+            "AddonPreferences", "Panel", "UIList", "PropertyGroup", "Context", "ShapeKey",
+            "OperatorFileListElement", "Object", "Mesh", "Armature")})
+    bpy_props = _module("bpy.props", __all__=list(props), **{name: _property for name in props})
+    handlers = _module(
+        "bpy.app.handlers", persistent=lambda f: f,
+        **{name: [] for name in ("depsgraph_update_post", "load_post", "undo_post", "redo_post",
+                                 "frame_change_pre", "frame_change_post")})
+    app = _module("bpy.app", handlers=handlers, version=(3, 3, 0), version_string="3.3.0 (fakebpy)",
+                  tempdir=tempfile.gettempdir() + os.sep, background=True)
+    path = _module("bpy.path", abspath=lambda p: p,
+                   display_name_from_filepath=lambda p: os.path.splitext(os.path.basename(p))[0])
+    utils = _module("bpy.utils", register_class=lambda cls: None, unregister_class=lambda cls: None)
+    bpy = _module("bpy", __fake__=True, types=bpy_types, props=bpy_props, app=app, path=path, utils=utils,
+                  data=types.SimpleNamespace(actions=BlendDataActions()), context=None)
+
+    class ImportHelper:
+        filepath = ''
+
+    io_utils = _module("bpy_extras.io_utils", ImportHelper=ImportHelper)
+    _module("bpy_extras", io_utils=io_utils)
+    return bpy
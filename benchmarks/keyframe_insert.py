@@ -0,0 +1,117 @@
+'''
+キーフレーム打ち込みの比較
+keyframe_points.insert()を1つずつ呼ぶ場合と
+keyframe.bulk_insert()でまとめて書き込む場合を比べる
+
+blender -b --python benchmarks/keyframe_insert.py -- <file.lab> [fps]
+python benchmarks/keyframe_insert.py <file.lab> [fps]
+    Blenderの外ではbpyの代わり（fakebpy.py）を使う。時間はBlenderの時間ではないので、bpyの呼び出し回数と
+    Python側のオーバーヘッドだけを出し、速度の比は出さない
+'''
+import os
+import sys
+import time
+
+import numpy as np
+
+try:
+    import bpy
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import fakebpy
+    bpy = fakebpy.install()
+else:
+    fakebpy = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import keyframe  # noqa: E402
+import lab  # noqa: E402
+
+
+def shapekey_keys(words: lab.lab_words, fps: float) -> dict[str, dict[float, float]]:
+    # generate_shapekey_actionと同じタイミングでキーを作る
+    keys = {}
+    table = words.table
+    for p, timingB, timingE, length in zip(table.phonemes(), table.timingB.tolist(),
+                                           table.timingE.tolist(), table.length().tolist()):
+        if p == 'pau':
+            continue
+        timing = [((timingB - 0.05), 0.0)]
+        if length > 0.1:
+            timing.extend([(timingB + 0.05, 1.0), (timingE - 0.05, 1.0)])
+        else:
+            timing.append(((timingB+timingE)/2, 1.0))
+        timing.append((timingE+0.05, 0.0))
+        fcurve_keys = keys.setdefault(p, {})
+        for t, v in timing:
+            fcurve_keys[t*fps] = v
+    return keys
+
+
+def insert_keys(fcurve, keys: dict[float, float], interpolation: int = None):
+    '''
+    {フレーム: 値}の辞書をフレーム順に並べてまとめて追加する
+    同じフレームのキーは後から入れた値で上書きされたものとして扱う
+    '''
+    frames = np.fromiter(keys.keys(), dtype=np.float64, count=len(keys))
+    values = np.fromiter(keys.values(), dtype=np.float64, count=len(keys))
+    order = np.argsort(frames, kind='stable')
+    keyframe.bulk_insert(fcurve, frames[order], values[order], interpolation)
+
+
+def write_insert(action, keys: dict[str, dict[float, float]]):
+    for p, fcurve_keys in keys.items():
+        fcurve = action.fcurves.new(f"key_blocks[\"{p}\"].value")
+        for frame, value in fcurve_keys.items():
+            fcurve.keyframe_points.insert(frame, value, options={'FAST'})
+        fcurve.update()
+
+
+def write_bulk(action, keys: dict[str, dict[float, float]]):
+    for p, fcurve_keys in keys.items():
+        fcurve = action.fcurves.new(f"key_blocks[\"{p}\"].value")
+        insert_keys(fcurve, fcurve_keys)
+        fcurve.update()
+
+
+def measure(write, keys) -> tuple[float, int, int]:
+    # (秒数, キーフレームの数, bpyの呼び出し回数。Blenderの中では数えないので0)
+    if fakebpy:
+        fakebpy.calls.clear()
+    action = bpy.data.actions.new("implab_benchmark")
+    start = time.perf_counter()
+    write(action, keys)
+    elapsed = time.perf_counter() - start
+    count = sum(len(fcurve.keyframe_points) for fcurve in action.fcurves)
+    bpy.data.actions.remove(action)
+    calls = sum(fakebpy.calls.values()) - 2 if fakebpy else 0  # actions.new, removeを除く
+    return elapsed, count, calls
+
+
+def main():
+    if fakebpy:
+        argv = sys.argv[1:]
+    else:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    if not argv:
+        print(__doc__)
+        return
+    fps = float(argv[1]) if len(argv) > 1 else 30.0
+
+    keys = shapekey_keys(lab.lab_words(argv[0]), fps)
+    insert_time, insert_count, insert_calls = measure(write_insert, keys)
+    bulk_time, bulk_count, bulk_calls = measure(write_bulk, keys)
+
+    print(f"keyframes : {insert_count} (bulk {bulk_count})")
+    if fakebpy:
+        # bpyの代わりの時間はPython側のオーバーヘッドだけなので、速度の比は出さない
+        print(f"bpy calls : insert {insert_calls} / bulk {bulk_calls}")
+        print(f"overhead  : insert {insert_time:.3f} s / bulk {bulk_time:.3f} s（bpyの代わり、Blenderでの時間ではない）")
+        return
+    print(f"insert    : {insert_time:.3f} s")
+    print(f"bulk      : {bulk_time:.3f} s")
+    print(f"speedup   : {insert_time / bulk_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+'''
+ベンチマーク用の.labファイルを合成する
+VOICEVOXが出力する.labと同じ形式（100ns単位、文頭と文末に'pau'、読点の'pau'、無声化母音の大文字）で、
+複数の文を書き出したときと同じく文の間は'pau'が2つ続く
+シードが同じなら同じ内容になる
+
+python benchmarks/synth.py <秒数> [-o out.lab] [--seed N]
+'''
+import argparse
+import random
+
+TICKS_PER_SECOND = 10_000_000
+
+VOWELS = ['a', 'i', 'u', 'e', 'o']
+# 出現しやすさの重み（おおよそ）
+CONSONANTS = {
+    'k': 9, 'g': 3, 's': 6, 'sh': 4, 'z': 2, 'j': 2, 't': 8, 'ch': 2, 'ts': 2, 'd': 4, 'n': 8,
+    'h': 3, 'f': 1, 'b': 2, 'p': 1, 'm': 5, 'y': 3, 'r': 6, 'w': 3,
+    'ky': 1, 'gy': 1, 'ny': 1, 'hy': 1, 'by': 1, 'py': 1, 'my': 1, 'ry': 1,
+}
+VOICELESS = {'k', 's', 'sh', 't', 'ch', 'ts', 'h', 'f', 'p', 'ky', 'hy', 'py'}
+
+
+def generate(seconds: float, seed: int = 0, speed: float = 1.0) -> list[tuple[int, int, str]]:
+    '''
+    (開始, 終了, 音素)の並びを返す。最後の文末の'pau'で指定した秒数以上になる
+    speed : 話す速さ（音素の長さを割る）
+    '''
+    rng = random.Random(seed)
+    consonants = list(CONSONANTS)
+    weights = list(CONSONANTS.values())
+    rows = []
+    end = 0
+
+    def put(p: str, length: float):
+        nonlocal end
+        begin, end = end, end + round(length * TICKS_PER_SECOND)
+        rows.append((begin, end, p))
+
+    while end < seconds * TICKS_PER_SECOND:
+        put('pau', rng.uniform(0.1, 0.2))  # 文頭
+        for phrase in range(rng.randint(1, 4)):
+            if phrase:  # 読点
+                put('pau', rng.uniform(0.2, 0.5))
+            for _ in range(rng.randint(3, 12)):  # モーラ
+                r = rng.random()
+                if r < 0.06:
+                    put('N', rng.uniform(0.06, 0.12) / speed)
+                    continue
+                if r < 0.10:
+                    put('cl', rng.uniform(0.05, 0.10) / speed)
+                    continue
+                c = rng.choices(consonants, weights)[0] if r < 0.75 else None
+                if c:
+                    put(c, rng.uniform(0.03, 0.09) / speed)
+                v = rng.choice(VOWELS)
+                if c in VOICELESS and v in 'iu' and rng.random() < 0.4:  # 無声化
+                    v = v.upper()
+                put(v, rng.uniform(0.06, 0.15) / speed)
+        put('pau', rng.uniform(0.4, 1.0))  # 文末
+    return rows
+
+
+def write(filepath: str, seconds: float, seed: int = 0, speed: float = 1.0) -> int:
+    # .labファイルに書き出して音素の数を返す
+    rows = generate(seconds, seed, speed)
+    with open(filepath, 'w', encoding='utf-8', newline='\n') as f:
+        f.writelines(f"{b} {e} {p}\n" for b, e, p in rows)
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VOICEVOX形式の.labファイルを合成する")
+    parser.add_argument("seconds", type=float)
+    parser.add_argument("-o", "--output", default="synth.lab")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--speed", type=float, default=1.0)
+    args = parser.parse_args()
+    count = write(args.output, args.seconds, args.seed, args.speed)
+    print(f"{args.output} : {count} 音素")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+'''
+.labの読み込みからNLAストリップの挿入までの処理速度
+合成した.lab（synth.py）とbpyの代わり（fakebpy.py）を使うので、Blenderなしで実行できる
+段階ごとに時間（繰り返しの最小）、メモリのピーク、1秒あたりの件数、bpyの呼び出し回数を表示する
+
+python benchmarks/throughput.py [秒数 ...] [--target MESH|ARMATURE] [--engine KEYS|COARTICULATION] [--repeat N] [--seed N]
+    [--decimate] [--single] [--json out.json]
+'''
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakebpy  # noqa: E402
+import synth  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+
+def load_addon(name: str = "import_lab") -> types.ModuleType:
+    # bpyの代わりを登録してからアドオンをパッケージとして読み込む
+    fakebpy.install()
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(ROOT, "__init__.py"), submodule_search_locations=[ROOT])
+    addon = importlib.util.module_from_spec(spec)
+    sys.modules[name] = addon
+    spec.loader.exec_module(addon)
+    return addon
+
+
+def make_target(addon, target: str, seed: int = 0):
+    '''
+    口形素の対応と挿入先のオブジェクト
+    リグは骨の位置をランダムに動かすポーズアクションを口形素ごとに作る
+    '''
+    phonemes = addon.lab.phoneme.phoneme_literals
+    rng = np.random.default_rng(seed)
+    obj = fakebpy.AnimatedID("Face")
+    obj.type = target
+    if target == 'MESH':
+        obj.data = types.SimpleNamespace(shape_keys=fakebpy.AnimatedID("Key"))
+        mapping = {p: f"口_{p}" for p in phonemes}
+    else:
+        mapping = {}
+        for p in phonemes:
+            pose = fakebpy.Action(f"pose_{p}")
+            for bone in rng.choice(12, size=4, replace=False):
+                for index in range(3):
+                    fcurve = pose.fcurves.new(f'pose.bones["口{bone}"].location', index, f"口{bone}")
+                    fcurve.keyframe_points.insert(1.0, float(rng.normal(0.0, 0.01)))
+            mapping[p] = pose
+    return obj, addon.viseme_profile(mapping, 'VOWEL_CONSONANTS', [])
+
+
+def make_operator(addon, target: str, decimate: bool, single: bool, engine: str = 'KEYS'):
+    class operator(addon.ImplabInsertBase):
+        def report(self, level, message):
+            print(f"{next(iter(level))} : {message}")
+
+    op = operator()
+    op.target = target
+    op.overwrite = True
+    op.use_scale = False
+    op.incremental = False
+    op.decimate = decimate
+    op.decimate_tolerance = 0.001
+    op.output = 'SINGLE' if single else 'SENTENCE'
+    op.chunk_minutes = 0.0
+    op.use_audio = False
+    op.audio_floor = 0.3
+    op.engine = engine
+    op.blend_shape = 'SMOOTH'
+    op.attack_time = 0.08
+    op.decay_time = 0.12
+    op.simplify_tolerance = addon.schedule.SIMPLIFY_TOLERANCE
+    op.loudness = None
+    op.trace = addon.instrument.trace("benchmark")
+    op.import_id = addon.new_import_id()
+    return op
+
+
+def measure(func, repeat: int, setup=None) -> tuple[float, int, object]:
+    '''
+    (最小の秒数, メモリのピーク, 最後の戻り値)
+    メモリは時間とは別にtracemallocを有効にして1回計測する
+    '''
+    best = float('inf')
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak, result
+
+
+def bench(addon, path: str, target: str, repeat: int, decimate: bool, single: bool, fps: int = 30,
+          engine: str = 'KEYS') -> list[dict]:
+    lab = addon.lab
+    obj, profile = make_target(addon, target)
+    context = types.SimpleNamespace(
+        active_object=obj,
+        scene=types.SimpleNamespace(render=types.SimpleNamespace(fps=fps), frame_current=1),
+        preferences=types.SimpleNamespace(edit=types.SimpleNamespace(keyframe_new_interpolation_type='BEZIER')))
+    op = make_operator(addon, target, decimate, single, engine)
+    visemes = op.build_visemes(context, profile)
+    results = []
+
+    def stage(name: str, func, count, unit: str, setup=None):
+        fakebpy.calls.clear()
+        seconds, peak, result = measure(func, repeat, setup)
+        n = count(result)
+        results.append({
+            "stage": name, "seconds": seconds, "peak_bytes": peak, "count": n, "unit": unit,
+            "per_second": n / seconds if seconds > 0 else float('inf'),
+            "bpy_calls": sum(fakebpy.calls.values()) // (repeat + 1),
+        })
+        return result
+
+    words = stage("parse", lambda: lab.lab_words(path), lambda w: len(w.table), "phonemes")
+    sentence = stage("split", words.split, len, "sentences")
+    schedules = stage("schedule", lambda: op.prepare_schedules(context, sentence, visemes),
+                      len, "sentences")
+
+    def generate():
+        op.trace = addon.instrument.trace("benchmark")
+        return op.generate_action(context, schedules, visemes, "benchmark")
+    actions = stage("generate", generate, lambda _: op.trace.counters.get("keys", 0), "keys",
+                    setup=fakebpy.clear_actions)
+
+    track = None
+
+    def new_track():
+        nonlocal track
+        track = fakebpy.NlaTrack(obj)
+
+    stage("insert_strips", lambda: op.insert_action_in_track(context, schedules, actions, track, 1),
+          lambda _: len(track.strips), "strips", setup=new_track)
+    return results
+
+
+def print_results(seconds: float, phonemes: int, results: list[dict]):
+    print(f"\n{seconds:g} 秒 ({phonemes} 音素)")
+    print(f"{'stage':<14}{'time (s)':>10}{'peak (MiB)':>12}{'count':>10}{'per second':>14}  unit{'bpy calls':>14}")
+    for r in results:
+        print(f"{r['stage']:<14}{r['seconds']:>10.4f}{r['peak_bytes'] / (1 << 20):>12.2f}{r['count']:>10}"
+              f"{r['per_second']:>14,.0f}  {r['unit']:<9}{r['bpy_calls']:>9}")
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="読み込みから挿入までの処理速度を計測する（Blender不要）")
+    parser.add_argument("seconds", type=float, nargs="*", default=[10.0, 600.0, 3600.0],
+                        help=".labの長さ（秒）")
+    parser.add_argument("--target", choices=("MESH", "ARMATURE"), default="MESH")
+    parser.add_argument("--engine", choices=("KEYS", "COARTICULATION"), default="KEYS", help="生成方法")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--decimate", action="store_true", help="キーを間引く")
+    parser.add_argument("--single", action="store_true", help="ファイル全体を1つのアクションにまとめる")
+    parser.add_argument("--json", help="結果を書き出すJSONファイル")
+    args = parser.parse_args(argv)
+
+    addon = load_addon()
+    report = []
+    with tempfile.TemporaryDirectory(prefix="implab_bench_") as tmp:
+        for seconds in args.seconds:
+            path = os.path.join(tmp, f"synth_{seconds:g}.lab")
+            phonemes = synth.write(path, seconds, args.seed)
+            addon.cache.poses.invalidate()
+            results = bench(addon, path, args.target, max(1, args.repeat), args.decimate, args.single,
+                            engine=args.engine)
+            print_results(seconds, phonemes, results)
+            report.append({"seconds": seconds, "phonemes": phonemes, "target": args.target, "engine": args.engine,
+                           "decimate": args.decimate, "single": args.single, "results": results})
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
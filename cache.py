@@ -0,0 +1,309 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# 解析済みの.labファイル、コンパイル結果、生成したキーフレームの配列のキャッシュ、NLAストリップの索引
+
+
+def file_hash(filepath: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _nbytes(value) -> int:
+    # lab_wordsと文のリストが保持する配列の大きさ
+    words, sentences = value
+    table = words.table
+    return table.begin.nbytes + table.end.nbytes + table.ids.nbytes + 64 * len(sentences)
+
+
+class lab_cache:
+    '''
+    解析、分割済みの.labファイルのLRUキャッシュ
+    パスごとに1つ保持し、更新時刻とサイズ（use_hashなら内容のハッシュも）が変わったら読み直す
+    budget : 保持する配列の合計バイト数の上限
+    '''
+
+    def __init__(self, budget: int = 64 << 20, use_hash: bool = False) -> None:
+        self.budget = budget
+        self.use_hash = use_hash
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def signature(self, filepath: str, sidecar: str = None) -> tuple:
+        st = os.stat(filepath)
+        signature = (st.st_mtime_ns, st.st_size)
+        if self.use_hash:
+            signature += (file_hash(filepath),)
+        if sidecar is not None:
+            try:
+                st = os.stat(sidecar)
+                signature += (st.st_mtime_ns, st.st_size)
+            except OSError:
+                pass
+        return signature
+
+    def get(self, filepath: str, load, sidecar: str = None):
+        '''
+        キャッシュがあればそれを、無ければload(filepath)の結果を保持して返す
+        loadは(lab_words, 文のリスト)を返す
+        sidecar : バイナリ形式のファイル。書き換えられたら古いメモリマップを捨てて読み直す
+        '''
+        path = os.path.abspath(filepath)
+        signature = self.signature(path, sidecar)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == signature:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = load(filepath)
+        size = _nbytes(value)
+        with self._lock:
+            if (old := self._entries.pop(path, None)) is not None:
+                self._size -= old[2]
+            if size <= self.budget:
+                self._entries[path] = (signature, value, size)
+                self._size += size
+                self._evict()
+        return value
+
+    def fits(self, filepath: str) -> bool:
+        # 読み込む前に、保持できる大きさか調べる（.labの解析後の配列はファイルより少し小さい）
+        try:
+            return os.path.getsize(filepath) <= self.budget
+        except OSError:
+            return False
+
+    def configure(self, budget: int, use_hash: bool = False):
+        with self._lock:
+            if use_hash != self.use_hash:
+                self._entries.clear()
+                self._size = 0
+            self.budget = budget
+            self.use_hash = use_hash
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def _evict(self):
+        while self._size > self.budget and self._entries:
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self._size -= size
+
+
+class pose_cache:
+    '''
+    口形素ポーズのテンプレートや口形素プロファイルなど、コンパイル結果のキャッシュ
+    signatureが変わるかinvalidate()されるまで同じものを返す
+    '''
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._entries: dict = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key, signature, compile):
+        entry = self._entries.get(key)
+        if entry and entry[0] == signature:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        template = compile()
+        self._entries[key] = (signature, template)
+        return template
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+
+class disk_cache:
+    '''
+    配列の辞書を.npzファイルとしてフォルダに保存するキャッシュ（Blenderを終了しても残る）
+    キーは内容から作ったハッシュで、使うたびに更新時刻を新しくし、上限を超えたら古いものから消す
+    directory : 保存先。空欄なら使わない
+    limit : ファイルの合計バイト数の上限
+    '''
+
+    def __init__(self, directory: str = '', limit: int = 512 << 20) -> None:
+        self.directory = directory
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, directory: str, limit: int):
+        self.directory = directory
+        self.limit = limit
+
+    @staticmethod
+    def key(*parts) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        for part in parts:
+            h.update(repr(part).encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def load(self, key: str) -> dict[str, np.ndarray]:
+        '''
+        キーの配列の辞書。無いか読めなければNone
+        '''
+        if not self.directory:
+            return None
+        path = self.path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return arrays
+
+    def store(self, key: str, arrays: dict[str, np.ndarray]):
+        # 別名で書いてから置き換える（他のBlenderが同時に読んでも壊れない）
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(temp, path)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+        self.evict()
+
+    def entries(self) -> list[tuple[float, int, str]]:
+        # (更新時刻, サイズ, パス)の古い順
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(".npz") and entry.is_file():
+                        st = entry.stat()
+                        entries.append((st.st_mtime, st.st_size, entry.path))
+        except OSError:
+            return []
+        return sorted(entries)
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self) -> int:
+        # 全て消して消した数を返す
+        count = 0
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+                count += 1
+            except OSError:
+                pass
+        self.hits = 0
+        self.misses = 0
+        return count
+
+
+class strip_index:
+    '''
+    NLAトラックのストリップの索引（読み込み元 -> {ストリップ名: 読み込みID}）
+    読み込み元のタグが無いストリップ（以前のバージョンで挿入したもの）は名前だけを保持し、
+    読み込み元の名前か、それに".001"のような番号が付いた名前と照合する
+    count : 索引にあるストリップの数。トラックのストリップの数と違えば作り直す
+    '''
+
+    def __init__(self) -> None:
+        self.sources: dict[str, dict[str, str]] = {}
+        self.legacy: set[str] = set()
+        self.count = 0
+
+    def add(self, name: str, source: str = None, import_id: str = ''):
+        if source is None:
+            self.legacy.add(name)
+        else:
+            self.sources.setdefault(source, {})[name] = import_id
+        self.count += 1
+
+    def discard(self, name: str, source: str = None):
+        if (names := self.sources.get(source)) is not None and name in names:
+            del names[name]
+            if not names:
+                del self.sources[source]
+        elif name in self.legacy:
+            self.legacy.remove(name)
+        else:
+            return
+        self.count -= 1
+
+    def names(self, source: str, import_id: str = None) -> list[str]:
+        # 読み込み元のストリップの名前。import_idを指定すればその読み込みのものだけ
+        names = [n for n, i in self.sources.get(source, {}).items() if import_id is None or i == import_id]
+        if self.legacy and not import_id:
+            pattern = re.compile(f"{re.escape(source)}(\\.[0-9]+)?")
+            names += [n for n in self.legacy if pattern.fullmatch(n)]
+        return names
+
+    def imports(self) -> dict[tuple[str, str], list[str]]:
+        # (読み込み元, 読み込みID) -> ストリップの名前。タグの無いものは番号を除いた名前ごとにまとめる
+        imports: dict[tuple[str, str], list[str]] = {}
+        for source, names in self.sources.items():
+            for name, import_id in names.items():
+                imports.setdefault((source, import_id), []).append(name)
+        for name in self.legacy:
+            imports.setdefault((re.sub(r"\.[0-9]+$", "", name), ''), []).append(name)
+        return imports
+
+
+labs = lab_cache()
+poses = pose_cache()
+profiles = pose_cache()  # アーマチュア、メッシュのポインター -> viseme_profile
+shapekeys = pose_cache()  # シェイプキー(Key)のポインター -> (列挙項目, 名前 -> 番号)
+disk = disk_cache()  # ファイル全体の予定表の配列
+tracks: dict[int, strip_index] = {}  # NLAトラックのポインター -> strip_index
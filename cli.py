@@ -0,0 +1,171 @@
+'''
+コマンドラインからの一括挿入
+
+マニフェスト(JSON)に書かれた(オブジェクト, .labファイル, 開始フレーム, 対象)を
+UIを使わずに挿入し、.blendファイルを保存する
+
+Blenderの中で実行する:
+    blender -b shot.blend --python-exit-code 1 --python-expr "import import_lab.cli; import_lab.cli.main()" -- manifest.json
+
+複数のショットファイルを並列に処理する（Blenderの外で実行する）:
+    python cli.py manifest.json -j 8 --blender /path/to/blender
+
+マニフェストの形式:
+    [
+        {"blend": "shot010.blend", "object": "Face", "lab": "voice/010.lab", "frame": 1, "target": "MESH"},
+        ...
+    ]
+    blend : 挿入先の.blendファイル（Blenderの中で実行する場合は省略でき、開いているファイルに挿入する）
+    target : 'ARMATURE' か 'MESH'（省略するとオブジェクトの種類から決める）
+    overwrite, use_scale, incremental, decimate, decimate_tolerance, output, chunk_minutes,
+    use_audio, audio_path, audio_floor, engine, blend_shape, attack_time, decay_time,
+    simplify_tolerance : 挿入オペレーターの設定（省略可）
+    相対パス（blend, lab, audio_path）はマニフェストのあるフォルダからのパス
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+OPTIONS = ("overwrite", "use_scale", "incremental", "decimate", "decimate_tolerance", "output", "chunk_minutes",
+           "use_audio", "audio_path", "audio_floor", "engine", "blend_shape", "attack_time", "decay_time",
+           "simplify_tolerance")
+
+
+def read_manifest(path: str) -> list[dict]:
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+    if isinstance(entries, dict):
+        entries = entries.get("entries", [])
+    base = os.path.dirname(os.path.abspath(path))
+    for entry in entries:
+        for key in ("blend", "lab", "audio_path"):
+            if entry.get(key):
+                entry[key] = os.path.normpath(os.path.join(base, entry[key]))
+    return entries
+
+
+def shard(entries: list[dict]) -> dict[str, list[dict]]:
+    # .blendファイルごとにまとめる（1ファイルを1プロセスで処理する）
+    shots: dict[str, list[dict]] = {}
+    for entry in entries:
+        if not entry.get("blend"):
+            raise ValueError(f".blendファイルが指定されていません: {entry}")
+        shots.setdefault(entry["blend"], []).append(entry)
+    return shots
+
+
+def insert(entry: dict):
+    '''
+    マニフェストの1項目を開いているファイルに挿入する（Blenderの中で呼ぶ）
+    '''
+    import bpy
+
+    obj = bpy.data.objects.get(entry["object"])
+    if obj is None:
+        raise KeyError(f"オブジェクトがありません: {entry['object']}")
+    target = entry.get("target", obj.type)
+    if target != obj.type:
+        raise ValueError(f"{obj.name} は {target} ではありません")
+
+    scene = bpy.context.scene
+    frame = scene.frame_current
+    options = {k: entry[k] for k in OPTIONS if k in entry}
+    try:
+        scene.frame_current = int(entry.get("frame", frame))
+        with bpy.context.temp_override(object=obj, active_object=obj, selected_objects=[obj]):
+            result = bpy.ops.importlab.insert(
+                'EXEC_DEFAULT', filepath=entry["lab"], target=target, **options)
+    finally:
+        scene.frame_current = frame
+    if 'FINISHED' not in result:
+        raise RuntimeError(f"挿入できませんでした: {entry['lab']} -> {obj.name}")
+
+
+def main(argv: list[str] = None):
+    '''
+    Blenderの中でマニフェストを処理して保存する
+    引数は '--' の後: マニフェスト [--no-save]
+    '''
+    import addon_utils
+    import bpy
+
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(prog="import_lab.cli")
+    parser.add_argument("manifest")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    package = __name__.rpartition('.')[0]
+    if package not in bpy.context.preferences.addons:
+        addon_utils.enable(package, default_set=True)
+
+    # 開いているファイル宛て（またはファイル指定なし）の項目だけを処理する
+    current = os.path.normpath(bpy.data.filepath) if bpy.data.filepath else None
+    entries = [e for e in read_manifest(args.manifest)
+               if not e.get("blend") or e["blend"] == current]
+    for entry in entries:
+        print(f"IMPLAB : {entry['lab']} -> {entry['object']}")
+        insert(entry)
+
+    if entries and not args.no_save:
+        bpy.ops.wm.save_mainfile()
+    print(f"IMPLAB : {len(entries)} 件を挿入しました")
+
+
+def run_shot(blender: str, blend: str, manifest: str, package: str, no_save: bool) -> tuple[int, str]:
+    expr = f"import {package}.cli; {package}.cli.main()"
+    command = [blender, "-b", blend, "--python-exit-code", "1",
+               "--python-expr", expr, "--", manifest]
+    if no_save:
+        command.append("--no-save")
+    proc = subprocess.run(command, stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT, text=True, errors='replace')
+    return proc.returncode, proc.stdout
+
+
+def launch(argv: list[str] = None) -> int:
+    '''
+    マニフェストをショットファイルごとに分け、Blenderを並列に起動して処理する
+    '''
+    parser = argparse.ArgumentParser(
+        description="マニフェストの.labをショットファイルごとに並列に挿入する")
+    parser.add_argument("manifest")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="同時に起動するBlenderの数")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"))
+    parser.add_argument("--package", default=os.path.basename(os.path.dirname(os.path.abspath(__file__))),
+                        help="アドオンのパッケージ名")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    shots = shard(read_manifest(args.manifest))
+    failed = []
+    with tempfile.TemporaryDirectory(prefix="implab_") as tmp:
+        jobs = []
+        for i, (blend, entries) in enumerate(shots.items()):
+            manifest = os.path.join(tmp, f"shot{i}.json")
+            with open(manifest, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False)
+            jobs.append((blend, manifest))
+
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+            results = executor.map(
+                lambda job: run_shot(args.blender, job[0], job[1], args.package, args.no_save), jobs)
+            for (blend, _), (code, output) in zip(jobs, results):
+                status = "OK" if code == 0 else f"FAILED ({code})"
+                print(f"{status} : {blend}")
+                if code != 0:
+                    failed.append(blend)
+                    print(output)
+
+    print(f"{len(shots) - len(failed)} / {len(shots)} ショット完了")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(launch())
@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 挿入処理の段階ごとの時間と件数の計測
+
+
+class trace:
+    '''
+    段階ごとの経過時間と呼び出し回数、件数のカウンター
+    ワーカースレッドからも記録できる。ワーカースレッドの時間は並列に進んだ時間の合計なので
+    worker_stagesに分けて記録し、totalには含めない（totalは作ったスレッドでの時間で、経過時間を超えない）
+    '''
+
+    def __init__(self, name: str = '') -> None:
+        self.name = name
+        self.started = time.time()
+        self.stages: dict[str, list] = {}  # 段階 -> [秒, 回数]
+        self.worker_stages: dict[str, list] = {}  # ワーカースレッドでの段階 -> [秒の合計, 回数]
+        self.counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._thread = threading.get_ident()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float):
+        stages = self.stages if threading.get_ident() == self._thread else self.worker_stages
+        with self._lock:
+            entry = stages.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def iterate(self, name: str, iterable):
+        # 要素を1つ取り出すごとにかかった時間を記録する（ジェネレーターの読み込み時間など）
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, time.perf_counter() - start)
+                return
+            self.add_time(name, time.perf_counter() - start)
+            yield item
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def total(self) -> float:
+        return sum(seconds for seconds, _ in self.stages.values())
+
+    def worker_total(self) -> float:
+        return sum(seconds for seconds, _ in self.worker_stages.values())
+
+    def summary(self) -> str:
+        stages = ", ".join(f"{name} {seconds * 1000:.1f}ms"
+                           for name, (seconds, _) in self.stages.items())
+        text = f"{self.total() * 1000:.1f}ms ({stages})"
+        if self.worker_stages:
+            workers = ", ".join(f"{name} {seconds * 1000:.1f}ms"
+                                for name, (seconds, _) in self.worker_stages.items())
+            text += f" ワーカー合計 {self.worker_total() * 1000:.1f}ms ({workers})"
+        counters = ", ".join(f"{name} {n}" for name, n in self.counters.items())
+        return f"{text} {counters}".rstrip()
+
+    def to_dict(self, **meta) -> dict:
+        return {
+            "name": self.name,
+            "started": self.started,
+            **meta,
+            "wall": time.time() - self.started,
+            "total": self.total(),
+            "stages": {name: {"seconds": seconds, "calls": calls}
+                       for name, (seconds, calls) in self.stages.items()},
+            "worker_total": self.worker_total(),
+            "worker_stages": {name: {"seconds": seconds, "calls": calls}
+                              for name, (seconds, calls) in self.worker_stages.items()},
+            "counters": dict(self.counters),
+        }
+
+    def write(self, directory: str, **meta) -> str:
+        '''
+        トレースをJSONファイルに書き出してパスを返す
+        meta : 一緒に記録する情報（対象、設定など）
+        '''
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(self.started))
+        name = "".join(c if c.isalnum() or c in "-_" else "_" for c in self.name)
+        millis = int(self.started * 1000) % 1000
+        path = os.path.join(directory, f"implab_trace_{stamp}{millis:03d}_{name}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(**meta), f, ensure_ascii=False, indent=2)
+        return path
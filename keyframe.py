@@ -0,0 +1,98 @@
+import numpy as np
+
+
+def bulk_insert(fcurve, frames, values, interpolation: int = None):
+    '''
+    キーフレームをまとめて追加する
+    keyframe_points.add()で一度に確保し、foreach_setで値を書き込む
+    frames, valuesはフレーム順に並べておく
+    interpolation : Keyframe.interpolationの列挙値
+    '''
+    points = fcurve.keyframe_points
+    count = len(frames)
+    if count == 0:
+        return
+    start = len(points)
+
+    co = np.empty((start + count, 2), dtype=np.float32)
+    if start:  # 既存のキーフレームは残す
+        points.foreach_get('co', co[:start].ravel())
+    co[start:, 0] = frames
+    co[start:, 1] = values
+
+    if interpolation is not None:
+        ipo = np.empty(start + count, dtype=np.int32)
+        if start:
+            points.foreach_get('interpolation', ipo[:start])
+        ipo[start:] = interpolation
+
+    points.add(count)
+    points.foreach_set('co', co.ravel())
+    if interpolation is not None:
+        points.foreach_set('interpolation', ipo)
+
+
+def decimate(frames, values, tolerance: float = 0.001, interpolation: str = 'BEZIER', fixed=None) -> np.ndarray:
+    '''
+    補間で再現できるキーフレームを間引く
+    残すキーの真偽値の配列を返す。両端のキーは常に残る
+    interpolation : 'CONSTANT' は直前と同じ値、'LINEAR' は前後を結ぶ直線上、
+                    それ以外（ベジェ）は前後と同じ値のキーを消す
+    残したキーで補間した値と元の全てのキーとの差はtolerance以下になる
+    fixed : 常に残すキーの真偽値の配列。複数の曲線をつなげて一度に間引くときは曲線の両端を指定する
+    '''
+    frames = np.asarray(frames, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    n = len(frames)
+    keep = np.ones(n, dtype=bool)
+    if n < 3:
+        return keep
+
+    def error(k, left, right):
+        # キーkを前後のキーleft, rightで補間したときの差
+        match interpolation:
+            case 'CONSTANT':
+                return np.abs(values[k] - values[left])
+            case 'LINEAR':
+                t = (frames[k] - frames[left]) / (frames[right] - frames[left])
+                return np.abs(values[k] - (values[left] + (values[right] - values[left]) * t))
+            case _:
+                return np.maximum(np.abs(values[k] - values[left]), np.abs(values[k] - values[right]))
+
+    # 消せるか調べるキー。最初は隣のキーで補間できるもの（fixed以外）、次からは前後の残っているキーが変わったものだけ
+    with np.errstate(divide='ignore', invalid='ignore'):  # 曲線のつなぎ目はfixedで除くので、そこでの0除算は無視する
+        ok = error(slice(1, -1), slice(None, -2), slice(2, None)) <= tolerance
+    if fixed is not None:
+        fixed = np.asarray(fixed, dtype=bool)
+        ok &= ~fixed[1:-1]
+    candidate = np.flatnonzero(ok) + 1
+    while len(candidate):
+        index = np.flatnonzero(keep)
+        at = np.cumsum(keep)[candidate] - 1  # 残っているキーの中での位置
+        left, right = index[at - 1], index[at + 1]
+        # 消したときに前後のキーで補間することになる元のキー全てとの誤差（消したキーの誤差が積み重ならない）
+        counts = right - left - 1
+        owner = np.repeat(np.arange(len(candidate)), counts)
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + left[owner] + 1
+        e = error(k, left[owner], right[owner])
+        drop = np.maximum.reduceat(e, np.cumsum(counts) - counts) <= tolerance
+        candidate, at = candidate[drop], at[drop]
+        if not len(candidate):
+            break
+        # 隣り合うキーを同時に消すと測っていない区間ができるので、続けて消せるキーは1つおきに消して繰り返す
+        first = np.ones(len(at), dtype=bool)
+        first[1:] = at[1:] != at[:-1] + 1
+        run_start = np.maximum.accumulate(np.where(first, np.arange(len(at)), 0))
+        take = (np.arange(len(at)) - run_start) % 2 == 0
+        keep[candidate[take]] = False
+        # 消したキーの前後のキーは補間の区間が変わるので調べ直す。1つおきで残したキーも
+        dirty = np.zeros(n, dtype=bool)
+        dirty[index[at[take] - 1]] = True
+        dirty[index[at[take] + 1]] = True
+        dirty[candidate[~take]] = True
+        dirty[[0, -1]] = False
+        dirty &= keep
+        if fixed is not None:
+            dirty &= ~fixed
+        candidate = np.flatnonzero(dirty)
+    return keep
@@ -1,9 +1,30 @@
+import array
 import datetime
+import json
+import os
+import re
+import struct
+import sys
+from collections.abc import Sequence
+
+import numpy as np
 
 # phoneme = 音素
 # vowel = 母音
 # consonants = 子音
 
+# .labの時間単位(100ns)
+TICKS_PER_SECOND = 10_000_000
+
+# バイナリ形式
+# ヘッダー : マジック, バージョン, 音素記号の数, 音素の数
+# 音素記号表 : (長さ uint8, UTF-8) の並び、8バイト境界まで0埋め
+# 列 : 開始 int64[n], 終了 int64[n], 音素番号 uint8[n]
+BINARY_EXT = ".labbin"
+BINARY_MAGIC = b"IMPLABB\0"
+BINARY_VERSION = 1
+_HEADER = struct.Struct("<8sIIQ")
+
 
 class phoneme:
     # phoneme_literals = ['a', 'i', 'u', 'e', 'o', 'N', 'k', 'g', 's', 'sh', 'z', 'j', 't', 'ch', 'ts', 'd', 'n',
@@ -51,19 +72,200 @@ class phoneme:
         return self.timingE - self.timingB
 
 
-class lab_words:
-    def __init__(self, filepath: str = ''):
-        self.phoneme_list: list[phoneme] = []
+class phoneme_view(phoneme):
+    '''
+    lab_tableの1行を参照するphoneme互換オブジェクト
+    値はテーブルの列から読み書きする
+    '''
+
+    def __init__(self, table: 'lab_table', index: int) -> None:
+        self._table = table
+        self._index = index
+
+    def __str__(self) -> str:
+        return f"{self._table.begin[self._index]} {self._table.end[self._index]} {self.phoneme}"
+
+    @property
+    def phoneme(self) -> str:
+        return self._table.symbols[self._table.ids[self._index]]
+
+    @property
+    def timingB(self) -> float:
+        return self._table.begin[self._index] / TICKS_PER_SECOND
+
+    @property
+    def timingE(self) -> float:
+        return self._table.end[self._index] / TICKS_PER_SECOND
+
+    @phoneme.setter
+    def phoneme(self, phoneme: str):
+        self._table.ids[self._index] = self._table.intern(phoneme)
+
+    @timingB.setter
+    def timingB(self, timing: int):
+        self._table.begin[self._index] = timing
+
+    @timingE.setter
+    def timingE(self, timing: int):
+        self._table.end[self._index] = timing
+
+
+class lab_table:
+    '''
+    音素を列ごとに保持するテーブル
+    begin, end : 開始、終了時刻 (100ns単位, int64)
+    ids : 音素記号表symbolsの番号 (uint8)
+    '''
+
+    def __init__(self, begin=(), end=(), ids=(), symbols: list[str] = None) -> None:
+        self.symbols: list[str] = symbols if symbols is not None else []
+        self.begin = np.asarray(begin, dtype=np.int64)
+        self.end = np.asarray(end, dtype=np.int64)
+        self.ids = np.asarray(ids, dtype=np.uint8)
+
+    @classmethod
+    def from_file(cls, filepath: str) -> 'lab_table':
+        with open(file=filepath, mode='r', encoding='utf-8') as f:
+            if f.read(1) != '\ufeff':  # BOM Check
+                f.seek(0)
+            return cls.from_lines(f)
+
+    @classmethod
+    def from_lines(cls, lines) -> 'lab_table':
+        table = cls()
+        index = {}
+        begin = array.array('q')
+        end = array.array('q')
+        ids = array.array('B')
+        for line in lines:
+            s = line.split()
+            if not s:
+                continue
+            if (id := index.get(s[2])) is None:
+                id = index[s[2]] = table.intern(s[2])
+            begin.append(int(s[0]))
+            end.append(int(s[1]))
+            ids.append(id)
+        table.begin = np.frombuffer(begin, dtype=np.int64)
+        table.end = np.frombuffer(end, dtype=np.int64)
+        table.ids = np.frombuffer(ids, dtype=np.uint8)
+        return table
 
-        if filepath != '':
-            with open(file=filepath, mode='r', encoding='utf-8') as f:
-                if f.read(1) != '\ufeff':  # BOM Check
-                    f.seek(0)
+    @classmethod
+    def from_seconds(cls, begin, end, phonemes) -> 'lab_table':
+        # 秒単位の開始、終了時刻と音素記号の並びから作る
+        table = cls()
+        table.begin = np.round(np.asarray(begin, dtype=np.float64) * TICKS_PER_SECOND).astype(np.int64)
+        table.end = np.round(np.asarray(end, dtype=np.float64) * TICKS_PER_SECOND).astype(np.int64)
+        index = {}
+        ids = array.array('B')
+        for p in phonemes:
+            if (id := index.get(p)) is None:
+                id = index[p] = table.intern(p)
+            ids.append(id)
+        table.ids = np.frombuffer(ids, dtype=np.uint8)
+        return table
 
-                for line in f:
-                    s = line.split()
-                    self.phoneme_list.append(
-                        phoneme(s[2], int(s[0]), int(s[1])))
+    @classmethod
+    def from_phonemes(cls, phoneme_list: list[phoneme]) -> 'lab_table':
+        table = cls()
+        table.begin = np.array([round(p.timingB * TICKS_PER_SECOND)
+                               for p in phoneme_list], dtype=np.int64)
+        table.end = np.array([round(p.timingE * TICKS_PER_SECOND)
+                             for p in phoneme_list], dtype=np.int64)
+        table.ids = np.array([table.intern(p.phoneme)
+                             for p in phoneme_list], dtype=np.uint8)
+        return table
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index: slice) -> 'lab_table':
+        # 列はnumpyのビューになり、記号表は共有する
+        return lab_table(self.begin[index], self.end[index], self.ids[index], self.symbols)
+
+    def intern(self, symbol: str) -> int:
+        try:
+            return self.symbols.index(symbol)
+        except ValueError:
+            if len(self.symbols) > np.iinfo(np.uint8).max:
+                raise ValueError(f"音素の種類が多すぎます : \"{symbol}\"")
+            self.symbols.append(symbol)
+            return len(self.symbols) - 1
+
+    def id_of(self, symbol: str) -> int:
+        return self.symbols.index(symbol) if symbol in self.symbols else -1
+
+    def phonemes(self) -> list[str]:
+        return [self.symbols[i] for i in self.ids.tolist()]
+
+    @property
+    def timingB(self) -> np.ndarray:
+        return self.begin / TICKS_PER_SECOND
+
+    @property
+    def timingE(self) -> np.ndarray:
+        return self.end / TICKS_PER_SECOND
+
+    def length(self) -> np.ndarray:
+        return (self.end - self.begin) / TICKS_PER_SECOND
+
+    def midpoint(self) -> np.ndarray:
+        return (self.begin + self.end) / (2 * TICKS_PER_SECOND)
+
+    @staticmethod
+    def to_frame(timing: np.ndarray, fps: float, offset: float = 0.0) -> np.ndarray:
+        return np.asarray(timing) * fps + offset
+
+    def sentence_ranges(self, sensitive: bool = False) -> np.ndarray:
+        '''
+        'pau'の連続で区切った文の範囲を(開始, 終了)の配列で返す
+        lab_words.split()と同じ区切りを1回の走査で求める
+        '''
+        n = len(self.ids)
+        if n == 0:
+            return np.empty((0, 2), dtype=np.int64)
+        pau = self.ids == self.id_of("pau")
+        # 各位置までで最後の'pau'以外の音素の位置
+        last = np.maximum.accumulate(np.where(pau, -1, np.arange(n)))
+        e = np.flatnonzero(~pau)
+        e = e[e > 0]
+        run_start = last[e - 1] + 1  # 直前の'pau'の連続の始まり
+        sen = 0 if sensitive else 1
+        split = (e - run_start > sen) & (run_start > 0)
+        e, run_start = e[split], run_start[split]
+        if len(e) == 0:
+            return np.empty((0, 2), dtype=np.int64)
+        trailing = n - 1 - last[-1]  # 末尾の'pau'の数
+        starts = np.r_[0, e - 1]
+        stops = np.r_[run_start, n - trailing]
+        return np.stack([starts, stops], axis=1).astype(np.int64)
+
+
+class _phoneme_sequence(Sequence):
+    '''lab_tableをphonemeのリストとして見せる'''
+
+    def __init__(self, table: lab_table) -> None:
+        self._table = table
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return _phoneme_sequence(self._table[index])
+        if index < 0:
+            index += len(self._table)
+        if not 0 <= index < len(self._table):
+            raise IndexError(index)
+        return phoneme_view(self._table, index)
+
+
+class lab_words:
+    def __init__(self, filepath: str = '', table: lab_table = None):
+        if table is None:
+            table = read(filepath) if filepath != '' else lab_table()
+        self.table = table
 
     def __str__(self) -> str:
         s = ""
@@ -71,26 +273,318 @@ class lab_words:
             s.join(f"{p.str()}\n")
         return s
 
-    def split(self, sensitive: bool = False) -> list['lab_words']:
-        sentence: list[lab_words] = []
-        pau = 0
-        s, e = 0, 0
-        sen = 0 if sensitive else 1
-        for p in self.phoneme_list:
-            if p.phoneme == "pau":
-                pau += 1
-            else:
-                if pau > sen:
-                    end = e-pau
-                    if s < end:
-                        w = lab_words()
-                        w.phoneme_list = self.phoneme_list[s:end]
-                        sentence.append(w)
-                        s = e-1
-                pau = 0
-            e += 1
-        if len(sentence) != 0:
-            w = lab_words()
-            w.phoneme_list = self.phoneme_list[s:e-pau]
-            sentence.append(w)
-        return sentence
+    @property
+    def phoneme_list(self) -> Sequence[phoneme]:
+        return _phoneme_sequence(self.table)
+
+    @phoneme_list.setter
+    def phoneme_list(self, phoneme_list: list[phoneme]):
+        self.table = lab_table.from_phonemes(phoneme_list)
+
+    def view(self, start: int, stop: int) -> 'lab_words':
+        # テーブルをコピーせずに一部を参照する
+        return lab_words(table=self.table[start:stop])
+
+    def split(self, sensitive: bool = False, ranges: bool = False):
+        '''
+        'pau'の連続で文に分ける
+        ranges : Trueなら文を作らず(開始, 終了)の配列を返す
+        '''
+        r = self.table.sentence_ranges(sensitive)
+        if ranges:
+            return r
+        return [self.view(s, e) for s, e in r.tolist()]
+
+
+def _read_rows(filepath: str, offset: int = 0):
+    # 1行ずつ(開始, 終了, 音素)を返す
+    with open(file=filepath, mode='rb') as f:
+        if offset > 0:
+            f.seek(offset - 1)
+            if f.read(1) != b'\n':  # 行の途中なら次の行から読む
+                f.readline()
+        elif f.read(3) != b'\xef\xbb\xbf':  # BOM Check
+            f.seek(0)
+
+        for line in f:
+            s = line.split()
+            if not s:
+                continue
+            yield int(s[0]), int(s[1]), s[2].decode('utf-8')
+
+
+def read_sentences(filepath: str, sensitive: bool = False, offset: int = 0, start_time: float = 0.0):
+    '''
+    lab_words.split()と同じ区切りで文を1つずつ返すジェネレーター
+    ファイル全体は読み込まず、'pau'による区切りが確定した時点で文を返す
+    offset : 読み始めるバイト位置（行の途中なら次の行から）
+    start_time : この時刻（秒）までに終わる音素は読み飛ばす
+    '''
+    symbols: list[str] = []
+    index: dict[str, int] = {}
+    start = round(start_time * TICKS_PER_SECOND)
+    sen = 0 if sensitive else 1
+
+    def sentence(rows: list[tuple[int, int, int]]) -> lab_words:
+        begin, end, ids = zip(*rows)
+        return lab_words(table=lab_table(begin, end, ids, symbols))
+
+    rows: list[tuple[int, int, int]] = []  # 区切りが確定していない音素
+    pau = 0
+    split = False
+    for timingB, timingE, p in _read_rows(filepath, offset):
+        if timingE <= start:
+            continue
+        if (id := index.get(p)) is None:
+            id = index[p] = len(symbols)
+            symbols.append(p)
+        if p == "pau":
+            pau += 1
+        else:
+            if pau > sen:
+                end = len(rows) - pau
+                if end > 0:
+                    yield sentence(rows[:end])
+                    split = True
+                    rows = rows[-1:]
+            pau = 0
+        rows.append((timingB, timingE, id))
+    if split:
+        yield sentence(rows[:len(rows) - pau])
+
+
+# 他の形式の読み込み
+# 拡張子と先頭部分の内容から読み込み関数を選び、.labと同じlab_tableを作る
+
+SILENCES = {'', 'sil', 'sp', 'silB', 'silE', 'spn', '#', '<sil>', 'pau'}  # 'pau'として扱う記号
+_readers: dict[str, object] = {}  # 拡張子 -> 読み込み関数
+_sniffers: list[tuple[object, object]] = []  # (内容の判定, 読み込み関数)
+
+
+def register_reader(extensions: list[str], read, sniff=None):
+    '''
+    読み込み関数を登録する
+    read(filepath) -> lab_table
+    sniff(head: bytes) -> bool : ファイルの先頭から形式を判定する（拡張子より優先）
+    '''
+    for ext in extensions:
+        _readers[ext.lower()] = read
+    if sniff is not None:
+        _sniffers.append((sniff, read))
+
+
+def extensions() -> list[str]:
+    return ['.lab'] + [ext for ext in _readers if ext != '.lab']
+
+
+def reader_for(filepath: str):
+    with open(filepath, 'rb') as f:
+        head = f.read(4096)
+    for sniff, read in _sniffers:
+        if sniff(head):
+            return read
+    return _readers.get(os.path.splitext(filepath)[1].lower(), lab_table.from_file)
+
+
+def readable(filepath: str) -> bool:
+    # 読み込める形式か（内容で判定できる形式は拡張子が同じでも内容が合わなければFalse）
+    with open(filepath, 'rb') as f:
+        head = f.read(4096)
+    if any(sniff(head) for sniff, _ in _sniffers):
+        return True
+    read = _readers.get(os.path.splitext(filepath)[1].lower(), lab_table.from_file)
+    return all(read is not r for _, r in _sniffers)
+
+
+def read(filepath: str) -> lab_table:
+    return reader_for(filepath)(filepath)
+
+
+def native(filepath: str) -> bool:
+    # 100ns単位の.labかどうか（read_sentencesで逐次読み込みできる）
+    return reader_for(filepath) == lab_table.from_file
+
+
+def _decode(data: bytes, errors: str = 'strict') -> str:
+    if data.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return data.decode('utf-16', errors)
+    return data.decode('utf-8-sig', errors)
+
+
+def _silence(symbol: str) -> str:
+    return 'pau' if symbol.strip() in SILENCES else symbol.strip()
+
+
+def read_htk(filepath: str) -> lab_table:
+    # HTK、Julius（segmentation-kit）の秒単位の.lab : 開始 終了 音素
+    with open(filepath, 'rb') as f:
+        rows = [line.split() for line in _decode(f.read()).splitlines()]
+    rows = [r for r in rows if len(r) >= 3]
+    return lab_table.from_seconds([float(r[0]) for r in rows], [float(r[1]) for r in rows],
+                                  [_silence(r[2]) for r in rows])
+
+
+def _sniff_htk(head: bytes) -> bool:
+    for line in head.splitlines()[:-1] or head.splitlines():
+        if s := line.split():
+            # 0から始まる行もあるので終了時刻も見る
+            return len(s) >= 3 and (b'.' in s[0] or b'.' in s[1])
+    return False
+
+
+_TEXTGRID_TOKEN = re.compile(r'"((?:[^"]|"")*)"|(?<![\w.\[])(-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)(?![\w\]])')
+PHONE_TIERS = {'phones', 'phone', 'phonemes', 'phoneme'}
+
+
+def read_textgrid(filepath: str) -> lab_table:
+    '''
+    PraatのTextGrid（長い形式、短い形式）
+    名前が'phones'などの区間層、無ければ最後の区間層を音素とする
+    '''
+    with open(filepath, 'rb') as f:
+        text = _decode(f.read())
+    text = re.sub(r'\[\s*\d+\s*\]', '', text)  # 長い形式の item [1]: intervals [1]: など
+    tokens = [string.replace('""', '"') if number == '' else float(number)
+              for string, number in _TEXTGRID_TOKEN.findall(text)]
+    # 'ooTextFile', 'TextGrid', xmin, xmax, 層の数, 層...
+    i = 4
+    count = int(tokens[i])
+    i += 1
+    tiers = []
+    for _ in range(count):
+        kind, name, n = tokens[i], tokens[i + 1], int(tokens[i + 4])
+        i += 5
+        width = 3 if kind == 'IntervalTier' else 2
+        if kind == 'IntervalTier':
+            tiers.append((name, tokens[i:i + n * width]))
+        i += n * width
+    if not tiers:
+        raise ValueError(f"区間層がありません: {filepath}")
+    name, items = next((t for t in tiers if t[0].lower() in PHONE_TIERS), tiers[-1])
+    return lab_table.from_seconds(items[0::3], items[1::3], [_silence(t) for t in items[2::3]])
+
+
+def _sniff_textgrid(head: bytes) -> bool:
+    return 'ooTextFile' in _decode(head[:128], 'ignore')
+
+
+def read_voicevox_query(filepath: str) -> lab_table:
+    '''
+    VOICEVOXのaudio_query（JSON）
+    VOICEVOXが書き出す.labと同じ順に子音、母音、句の後の無音を並べ、前後に無音を置く
+    '''
+    with open(filepath, encoding='utf-8-sig') as f:
+        query = json.load(f)
+    speed = query.get('speedScale', 1.0) or 1.0
+    pause_scale = query.get('pauseLengthScale', 1.0)
+    pause_length = query.get('pauseLength')
+
+    phonemes = ['pau']
+    lengths = [query.get('prePhonemeLength', 0.0)]
+    for phrase in query['accent_phrases']:
+        for mora in phrase['moras']:
+            if mora.get('consonant'):
+                phonemes.append(mora['consonant'])
+                lengths.append(mora['consonant_length'] or 0.0)
+            phonemes.append(mora['vowel'])  # 無声化した母音（'I', 'U'など）も.labと同じく大文字のまま
+            lengths.append(mora['vowel_length'])
+        if pause := phrase.get('pause_mora'):
+            phonemes.append('pau')
+            length = pause_length if pause_length is not None else pause['vowel_length']
+            lengths.append(length * pause_scale)
+    phonemes.append('pau')
+    lengths.append(query.get('postPhonemeLength', 0.0))
+
+    bounds = np.r_[0.0, np.cumsum(np.asarray(lengths, dtype=np.float64) / speed)]
+    return lab_table.from_seconds(bounds[:-1], bounds[1:], phonemes)
+
+
+def _sniff_voicevox_query(head: bytes) -> bool:
+    return head.lstrip()[:1] == b'{' and b'"accent_phrases"' in head
+
+
+register_reader(['.textgrid'], read_textgrid, _sniff_textgrid)
+register_reader(['.json'], read_voicevox_query, _sniff_voicevox_query)
+register_reader([], read_htk, _sniff_htk)
+
+
+def sidecar_path(filepath: str) -> str:
+    # 拡張子ごと残す（foo.labとfoo.jsonが同じファイルを使わないように）
+    return filepath + BINARY_EXT
+
+
+def sidecar(filepath: str) -> str | None:
+    # .labより新しいバイナリ形式のファイルがあればそのパス
+    path = sidecar_path(filepath)
+    try:
+        if os.stat(path).st_mtime_ns >= os.stat(filepath).st_mtime_ns:
+            return path
+    except OSError:
+        pass
+    return None
+
+
+def save_binary(table: lab_table, filepath: str):
+    '''
+    バイナリ形式で保存する
+    別のファイルに書いてから置き換えるので、読み込み済みのメモリマップは古い内容のまま残る
+    '''
+    symbols = b"".join(bytes([len(b)]) + b for b in (s.encode('utf-8') for s in table.symbols))
+    symbols += bytes(-(_HEADER.size + len(symbols)) % 8)
+    temp = f"{filepath}.{os.getpid()}.tmp"
+    try:
+        with open(temp, 'wb') as f:
+            f.write(_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(table.symbols), len(table)))
+            f.write(symbols)
+            f.write(np.ascontiguousarray(table.begin, dtype='<i8').tobytes())
+            f.write(np.ascontiguousarray(table.end, dtype='<i8').tobytes())
+            f.write(np.ascontiguousarray(table.ids, dtype=np.uint8).tobytes())
+        os.replace(temp, filepath)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def load_binary(filepath: str) -> lab_words:
+    '''
+    バイナリ形式のファイルをメモリマップで読み込む
+    列はコピーせずにファイルを参照する
+    '''
+    with open(filepath, 'rb') as f:
+        magic, version, nsym, count = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != BINARY_MAGIC or version != BINARY_VERSION:
+            raise ValueError(f"対応していないファイル形式 : \"{filepath}\"")
+        symbols = []
+        for _ in range(nsym):
+            length = f.read(1)[0]
+            symbols.append(f.read(length).decode('utf-8'))
+        offset = f.tell()
+    offset += -offset % 8
+
+    if count == 0:
+        return lab_words(table=lab_table(symbols=symbols))
+    # 書き換えはファイルに反映しない
+    begin = np.memmap(filepath, dtype='<i8', mode='c', offset=offset, shape=(count,))
+    end = np.memmap(filepath, dtype='<i8', mode='c', offset=offset + 8 * count, shape=(count,))
+    ids = np.memmap(filepath, dtype=np.uint8, mode='c', offset=offset + 16 * count, shape=(count,))
+    return lab_words(table=lab_table(begin, end, ids, symbols))
+
+
+def convert(filepath: str) -> str:
+    # .lab（または読み込める他の形式）をバイナリ形式に変換し、そのパスを返す
+    path = sidecar_path(filepath)
+    save_binary(read(filepath), path)
+    return path
+
+
+def load(filepath: str) -> lab_words:
+    # .labより新しいバイナリ形式のファイルがあればそちらを読み込む
+    if (path := sidecar(filepath)) is not None:
+        return load_binary(path)
+    return lab_words(filepath)
+
+
+if __name__ == "__main__":
+    # python lab.py <file.lab> ... : バイナリ形式に変換する
+    for filepath in sys.argv[1:]:
+        print(convert(filepath))
@@ -0,0 +1,101 @@
+import bisect
+
+import numpy as np
+
+# ライブモード
+# キーフレームを打たずに、フレームが変わるたびに口形素の値を求めてプロパティに直接書き込む
+
+
+class player:
+    '''
+    文ごとのキー（チャンネル、フレーム順、シーンのフレーム）と文の区間の索引
+    文の開始、終了フレームを二分探索して今の文を引き、チャンネルごとにキーの間を補間する
+    NLAストリップ（外挿なし）と同じく、文の外やキーの無いチャンネルはrestの値になる
+    target : 'ARMATURE' か 'MESH'
+    channels : チャンネルの一覧 (data_path, index, group)
+    rest : チャンネルごとの文の外での値
+    interpolation : 'CONSTANT', 'LINEAR', それ以外はベジェに近い補間（smoothstep）
+    '''
+
+    def __init__(self, target: str, channels: list[tuple[str, int, str]], rest, interpolation: str = 'BEZIER') -> None:
+        self.target = target
+        self.channels = list(channels)
+        self.rest = np.asarray(rest, dtype=np.float64)
+        self.interpolation = interpolation
+        self.begins: list[float] = []
+        self.ends: list[float] = []
+        self._sentences: list[tuple] = []
+        self.last = None  # 最後に書き込んだ値
+
+    def __len__(self) -> int:
+        return len(self._sentences)
+
+    def add(self, channels: np.ndarray, frames: np.ndarray, values: np.ndarray, begin: float, end: float):
+        '''
+        1文分のキーを追加する（文は開始フレーム順に追加する）
+        channels, frames, values : チャンネル、フレーム順のキー。フレームはシーンのフレーム
+        '''
+        if len(frames) == 0:
+            return
+        # チャンネルの順位 * 幅 + 文の先頭からのフレーム で全チャンネルを1回の二分探索で引く
+        keyed, first = np.unique(channels, return_index=True)
+        rank = np.repeat(np.arange(len(keyed)), np.diff(np.r_[first, len(channels)]))
+        span = end - begin + 1.0
+        composite = rank * span + (frames - begin)
+        self._sentences.append((keyed, first, np.r_[first[1:], len(channels)] - 1, span,
+                                composite, frames, values))
+        self.begins.append(begin)
+        self.ends.append(end)
+
+    @classmethod
+    def from_schedules(cls, target: str, channels: list, rest, schedules, frame: float, scale: float = 1.0,
+                       interpolation: str = 'BEZIER') -> 'player':
+        '''
+        文の予定表から作る。ストリップと同じく、文はint(start + frame)から始まり、
+        アクションの最初のキーがその位置に来るようにscale倍して並べる
+        '''
+        p = cls(target, channels, rest, interpolation)
+        for s in schedules:
+            if not len(s):
+                continue
+            origin = float(s.frames.min())
+            begin = float(int(s.start + frame))
+            frames = begin + (s.frames - origin) * scale
+            p.add(s.channels, frames, s.values, begin, float(frames.max()))
+        return p
+
+    def evaluate(self, frame: float) -> np.ndarray:
+        # フレームでの全チャンネルの値
+        values = self.rest.copy()
+        i = bisect.bisect_right(self.begins, frame) - 1
+        if i < 0 or frame > self.ends[i]:
+            return values
+        keyed, first, last, span, composite, frames, keys = self._sentences[i]
+        index = np.searchsorted(composite, np.arange(len(keyed)) * span + (frame - self.begins[i]), 'right')
+        a = np.clip(index - 1, first, last)
+        b = np.clip(index, first, last)
+        f0, f1 = frames[a], frames[b]
+        t = np.clip(np.divide(frame - f0, f1 - f0, out=np.zeros(len(a)), where=f1 > f0), 0.0, 1.0)
+        match self.interpolation:
+            case 'CONSTANT':
+                t = np.zeros_like(t)
+            case 'LINEAR':
+                pass
+            case _:
+                t = t * t * (3.0 - 2.0 * t)
+        values[keyed] = keys[a] + (keys[b] - keys[a]) * t
+        return values
+
+    def changes(self, frame: float) -> list[tuple[int, float]]:
+        # 前回から値が変わったチャンネルの(番号, 値)。nanのチャンネルは書き込まない
+        values = self.evaluate(frame)
+        write = ~np.isnan(values)
+        if self.last is not None:
+            write &= values != self.last
+        self.last = values
+        index = np.flatnonzero(write)
+        return list(zip(index.tolist(), values[index].tolist()))
+
+
+# オブジェクト名 -> player
+players: dict[str, player] = {}
@@ -0,0 +1,555 @@
+import hashlib
+
+import numpy as np
+
+# bpyに依存しないキーフレーム予定表の生成
+# 台詞(lab_words)と口形素の対応からチャンネル、フレーム、値の配列を作る
+
+LONG_PHONEME = 0.1  # これより長い発音はキーフレームを2つ打つ
+RAMP = 0.05  # 発音の前後に置くキーフレームまでの時間
+VERSION = 2  # 予定表の作り方を変えたら上げる（ディスクキャッシュのキーに使う）
+
+# 調音結合で口形素を混ぜるときの音素の優位度。口を閉じる、すぼめる子音は前後の母音に負けないよう強くする
+DOMINANCE = {'N': 1.0, 'm': 1.0, 'my': 1.0, 'b': 1.0, 'by': 1.0, 'p': 1.0, 'py': 1.0,
+             'f': 0.8, 'v': 0.8, 'w': 0.7, 'cl': 0.5}
+VOWEL_DOMINANCE = 0.6  # a, i, u, e, o
+CONSONANT_DOMINANCE = 0.3  # その他
+SIMPLIFY_TOLERANCE = 0.05  # 調音結合のフレームごとのキーを間引くときの許容誤差の既定値（チャンネルごとのポーズの差分の大きさに対する比）
+
+
+class pose_template:
+    '''
+    口形素ポーズを配列にしたもの
+    channels : チャンネルの一覧 (data_path, index, group)
+    values : チャンネルごとの値
+    '''
+
+    def __init__(self, channels: list[tuple[str, int, str]], values) -> None:
+        self.channels = list(channels)
+        self.values = np.asarray(values, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.channels)
+
+
+class viseme_map:
+    '''
+    音素と口形素ポーズの対応
+    channels : チャンネルの一覧 (data_path, index, group)。groupは最初にそのチャンネルを使ったポーズのもの
+    poses : 音素 -> (チャンネル番号の配列, 値の配列)
+    '''
+
+    def __init__(self, channels: list[tuple[str, int, str]] = None, poses: dict[str, tuple] = None) -> None:
+        self.channels: list[tuple[str, int, str]] = channels if channels is not None else []
+        self._channel_index = {c[:2]: i for i, c in enumerate(self.channels)}
+        self.poses: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self._flat = None
+        self._digest = None
+        self._templates: dict[int, tuple[pose_template, np.ndarray]] = {}
+        for p, (channels, values) in (poses or {}).items():
+            self.set_pose(p, channels, values)
+
+    def channel(self, data_path: str, index: int = 0, group: str = '') -> int:
+        # F-カーブは(data_path, index)で決まるので、グループは最初に見たものを使う
+        key = (data_path, index)
+        if (i := self._channel_index.get(key)) is None:
+            i = self._channel_index[key] = len(self.channels)
+            self.channels.append((data_path, index, group))
+        return i
+
+    def set_pose(self, phoneme: str, channels, values):
+        self.poses[phoneme] = (np.asarray(channels, dtype=np.int32),
+                               np.asarray(values, dtype=np.float64))
+        self._flat = None
+        self._digest = None
+
+    def set_template(self, phoneme: str, template: pose_template):
+        # テンプレートのチャンネルをこの対応のチャンネル番号に変換する（テンプレートごとに1回）
+        if (entry := self._templates.get(id(template))) is None:
+            channels = np.array([self.channel(*c) for c in template.channels], dtype=np.int32)
+            entry = self._templates[id(template)] = (template, channels)
+        self.poses[phoneme] = (entry[1], template.values)
+        self._flat = None
+        self._digest = None
+
+    def digest(self) -> bytes:
+        # 対応の内容のハッシュ（文の指紋に使う）
+        if self._digest is None:
+            h = hashlib.blake2b(digest_size=16)
+            for p in sorted(self.poses):
+                channels, values = self.poses[p]
+                h.update(p.encode())
+                for c in channels.tolist():
+                    h.update(repr(self.channels[c]).encode())
+                h.update(values.tobytes())
+            self._digest = h.digest()
+        return self._digest
+
+    def _flatten(self):
+        # 全ポーズを連結した配列 (ポーズ番号, 長さ, 開始位置, チャンネル, 値)
+        if self._flat is None:
+            names = list(self.poses)
+            lengths = np.array([len(self.poses[p][0]) for p in names], dtype=np.int64)
+            if names:
+                channels = np.concatenate([self.poses[p][0] for p in names])
+                values = np.concatenate([self.poses[p][1] for p in names])
+            else:
+                channels = np.empty(0, dtype=np.int32)
+                values = np.empty(0, dtype=np.float64)
+            self._flat = ({p: i for i, p in enumerate(names)}, lengths,
+                          np.cumsum(lengths) - lengths, channels, values)
+        return self._flat
+
+    def pose_ids(self, words, first: bool = False) -> np.ndarray:
+        # 音素ごとのポーズ番号、ポーズが無い音素は-1
+        pose_index = self._flatten()[0]
+        table = words.table
+        lut = np.array([pose_index.get(s, -1) for s in table.symbols] + [-1], dtype=np.int64)
+        ids = lut[table.ids]
+        if first and len(ids) and table.symbols[table.ids[0]] == 'pau':
+            ids[0] = pose_index.get('N', -1)
+        return ids
+
+
+class sentence_schedule:
+    '''
+    1文分のキーフレーム予定
+    channels, frames, values : チャンネル番号、フレーム、値（チャンネル、フレーム順）
+    start : ストリップの開始フレーム（挿入フレームからの相対、シーンのフレームレート）
+    fingerprint : 文の位置によらない内容の指紋。同じなら同じアクションになる
+    bounds : 複数の文をまとめた場合、各文の最初のキーのフレーム（アクションのフレームレート）
+    '''
+
+    def __init__(self, channels: np.ndarray, frames: np.ndarray, values: np.ndarray, start: float, fingerprint: str = '',
+                 bounds: list[float] = None) -> None:
+        self.channels = channels
+        self.frames = frames
+        self.values = values
+        self.start = start
+        self.fingerprint = fingerprint
+        self.bounds = bounds
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def curves(self):
+        # チャンネルごとに(チャンネル番号, フレーム, 値)を返す
+        bounds = np.flatnonzero(np.diff(self.channels)) + 1
+        for s, e in zip(np.r_[0, bounds], np.r_[bounds, len(self.channels)]):
+            if s < e:
+                yield int(self.channels[s]), self.frames[s:e], self.values[s:e]
+
+
+def start_frame(words, fps: float, first: bool = False) -> float:
+    table = words.table
+    return _start_frame(table, table.timingB, table.timingE, fps, first)
+
+
+def _start_frame(table, timingB: np.ndarray, timingE: np.ndarray, fps: float, first: bool) -> float:
+    if not len(timingB):
+        return 0.0
+    # ファイル先頭の'pau'は'N'として扱うので、その場合は先頭から
+    i = 1 if not first and table.symbols[table.ids[0]] == 'pau' and len(timingB) > 1 else 0
+    if timingE[i] - timingB[i] > LONG_PHONEME:
+        return float((timingB[i] + RAMP) * fps)
+    return float((timingB[i] + timingE[i]) / 2 * fps)
+
+
+def fingerprint(words, ids: np.ndarray, visemes: viseme_map, fps: float, scene_fps: float, tag: str = '',
+                gain: np.ndarray = None) -> str:
+    '''
+    ポーズ番号の並び、最初のポーズのある音素からの相対的なタイミング、口形素の対応、フレームレートの指紋
+    前後のポーズの無い音素（文の前後の'pau'）はキーを作らないので含めない。
+    文の前の無音の長さが変わっても指紋は同じで、位置の違いはストリップの開始フレームだけに表れる
+    tag : 生成の設定など、アクションの中身を変えるものを文字列にしたもの
+    gain : 音量による係数
+    '''
+    table = words.table
+    posed = np.flatnonzero(ids >= 0)
+    first, last = (int(posed[0]), int(posed[-1]) + 1) if len(posed) else (0, 0)
+    origin = table.begin[first] if len(posed) else 0
+    h = hashlib.blake2b(digest_size=16)
+    h.update(ids[first:last].astype(np.int64).tobytes())
+    h.update((table.begin[first:last] - origin).tobytes())
+    h.update((table.end[first:last] - origin).tobytes())
+    h.update(np.array([fps, scene_fps], dtype=np.float64).tobytes())
+    h.update(visemes.digest())
+    h.update(tag.encode())
+    if gain is not None:
+        h.update(gain.astype(np.float64).tobytes())
+    return h.hexdigest()
+
+
+def merge_holds(ids: np.ndarray, timingB: np.ndarray, timingE: np.ndarray):
+    '''
+    同じポーズの発音が途切れずに続く場合は1つの発音にまとめる
+    (ポーズ番号, 開始, 終了)を返す。先頭の行は常に残る
+    '''
+    touch = (ids[1:] == ids[:-1]) & (ids[1:] >= 0) & (timingB[1:] <= timingE[:-1])
+    head = np.r_[True, ~touch]
+    starts = np.flatnonzero(head)
+    if len(starts) == len(ids):
+        return ids, timingB, timingE
+    return ids[starts], timingB[starts], np.maximum.reduceat(timingE, starts)
+
+
+def _keys(visemes: viseme_map, ids: np.ndarray, times: np.ndarray, scales: np.ndarray,
+          gain: np.ndarray = None, rest: np.ndarray = None):
+    '''
+    音素ごとのタイミングにポーズのキーを展開する
+    times : (音素数, k) キーを打つフレーム、nanは打たない
+    scales : (音素数, k) ポーズの値に掛ける係数
+    gain : 音素ごとの強さ。restが無ければ値に掛け、あればチャンネルごとのrestの値との間で補間する
+    rest : チャンネルごとの基準の値、nanのチャンネルは補間しない
+    '''
+    _, lengths, offsets, pose_channels, pose_values = visemes._flatten()
+    valid = (ids >= 0)[:, None] & ~np.isnan(times)
+    rows, cols = np.nonzero(valid)  # 音素の順
+    pose = ids[rows]
+    counts = lengths[pose]
+    repeat = np.repeat(np.arange(len(rows)), counts)
+    within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    src = offsets[pose][repeat] + within
+
+    channels = pose_channels[src]
+    frames = times[rows, cols][repeat]
+    values = pose_values[src] * scales[rows, cols][repeat]
+    if gain is not None:
+        g = gain[rows][repeat]
+        if rest is None:
+            values = values * g
+        else:
+            r = rest[channels]
+            values = np.where(np.isnan(r), values, r + (values - r) * g)
+    return _dedupe(channels, frames, values)
+
+
+def rest_pose(visemes: viseme_map, phoneme: str = 'N') -> np.ndarray:
+    # チャンネルごとの口を閉じたポーズの値（ポーズに無いチャンネルはnan）
+    rest = np.full(len(visemes.channels), np.nan)
+    if phoneme in visemes.poses:
+        channels, values = visemes.poses[phoneme]
+        rest[channels] = values
+    return rest
+
+
+def _dedupe(channels: np.ndarray, frames: np.ndarray, values: np.ndarray):
+    # 同じチャンネル、フレームのキーは後のものを残し、チャンネル、フレーム順に並べる
+    order = np.lexsort((np.arange(len(frames)), frames, channels))
+    channels, frames, values = channels[order], frames[order], values[order]
+    last = np.ones(len(frames), dtype=bool)
+    last[:-1] = (channels[1:] != channels[:-1]) | (frames[1:] != frames[:-1])
+    return channels[last], frames[last], values[last]
+
+
+def rig_schedule(words, visemes: viseme_map, fps: float, scene_fps: float = None, first: bool = False,
+                 merge: bool = False, tag: str = '', loudness=None) -> sentence_schedule:
+    '''
+    ポーズのキーを発音の中央（長い場合は始めと終わり）に打つ
+    '''
+    table = words.table
+    all_ids = visemes.pose_ids(words, first)
+    ids, timingB, timingE = all_ids, table.timingB, table.timingE
+    if merge:
+        ids, timingB, timingE = merge_holds(ids, timingB, timingE)
+    gain = loudness.gain(timingB, timingE) if loudness is not None else None
+    long = (timingE - timingB) > LONG_PHONEME
+
+    times = np.empty((len(ids), 2))
+    times[:, 0] = np.where(long, timingB + RAMP, (timingB + timingE) / 2)
+    times[:, 1] = np.where(long, timingE - RAMP, np.nan)
+    times *= fps
+    scales = np.ones_like(times)
+
+    scene_fps = scene_fps or fps
+    rest = rest_pose(visemes) if gain is not None else None
+    return sentence_schedule(*_keys(visemes, ids, times, scales, gain, rest),
+                             _start_frame(table, timingB, timingE, scene_fps, first),
+                             fingerprint(words, all_ids, visemes, fps, scene_fps, tag + ("+merge" if merge else ""), gain))
+
+
+def shapekey_schedule(words, visemes: viseme_map, fps: float, scene_fps: float = None, first: bool = False,
+                      merge: bool = False, tag: str = '', loudness=None) -> sentence_schedule:
+    '''
+    発音の前後で0、発音中はポーズの値になるキーを打つ
+    '''
+    table = words.table
+    all_ids = visemes.pose_ids(words, first)
+    ids, timingB, timingE = all_ids, table.timingB, table.timingE
+    if merge:
+        ids, timingB, timingE = merge_holds(ids, timingB, timingE)
+    gain = loudness.gain(timingB, timingE) if loudness is not None else None
+    long = (timingE - timingB) > LONG_PHONEME
+
+    times = np.empty((len(ids), 4))
+    times[:, 0] = timingB - RAMP
+    times[:, 1] = np.where(long, timingB + RAMP, (timingB + timingE) / 2)
+    times[:, 2] = np.where(long, timingE - RAMP, np.nan)
+    times[:, 3] = timingE + RAMP
+    times *= fps
+    scales = np.zeros_like(times)
+    scales[:, 1:3] = 1.0
+
+    scene_fps = scene_fps or fps
+    return sentence_schedule(*_keys(visemes, ids, times, scales, gain),
+                             _start_frame(table, timingB, timingE, scene_fps, first),
+                             fingerprint(words, all_ids, visemes, fps, scene_fps, tag + ("+merge" if merge else ""), gain))
+
+
+class blend_kernel:
+    '''
+    調音結合で発音の前後に口形素が現れ、消えていく形
+    shape : 'SMOOTH'（smoothstep）, 'LINEAR', 'GAUSSIAN'
+    attack : 発音の開始より前に現れ始める時間（秒）
+    decay : 発音の終了から消えるまでの時間（秒）
+    '''
+
+    def __init__(self, shape: str = 'SMOOTH', attack: float = 0.08, decay: float = 0.12) -> None:
+        self.shape = shape
+        self.attack = attack
+        self.decay = decay
+
+    def __repr__(self) -> str:
+        return f"blend_kernel({self.shape!r}, {self.attack!r}, {self.decay!r})"
+
+    @staticmethod
+    def _ratio(distance: np.ndarray, width: float) -> np.ndarray:
+        if width > 0:
+            return distance / width
+        return np.where(distance > 0, np.inf, 0.0)
+
+    def activation(self, before: np.ndarray, after: np.ndarray) -> np.ndarray:
+        '''
+        発音の開始までの時間before、終了からの時間after（発音中はどちらも0）での強さ（0～1）
+        '''
+        x = np.maximum(self._ratio(before, self.attack), self._ratio(after, self.decay))
+        y = np.clip(1.0 - x, 0.0, 1.0)
+        match self.shape:
+            case 'LINEAR':
+                return y
+            case 'GAUSSIAN':  # 端で0になるようにずらしたガウス関数
+                edge = np.exp(-4.5)
+                return np.where(y > 0, (np.exp(-4.5 * np.minimum(x, 1.0) ** 2) - edge) / (1.0 - edge), 0.0)
+            case _:
+                return y * y * (3.0 - 2.0 * y)
+
+
+def dominance(phoneme: str) -> float:
+    if phoneme in DOMINANCE:
+        return DOMINANCE[phoneme]
+    return VOWEL_DOMINANCE if phoneme in ('a', 'i', 'u', 'e', 'o') else CONSONANT_DOMINANCE
+
+
+def channel_rest(visemes: viseme_map, phoneme: str = 'N') -> np.ndarray:
+    # 口形素を混ぜる基準の値。ポーズに無いチャンネルは既定値（クォータニオンのw、スケールは1、他は0）
+    rest = rest_pose(visemes, phoneme)
+    for i in np.flatnonzero(np.isnan(rest)).tolist():
+        data_path, index, _ = visemes.channels[i]
+        one = data_path.endswith("scale") or (data_path.endswith("rotation_quaternion") and index == 0)
+        rest[i] = 1.0 if one else 0.0
+    return rest
+
+
+def coarticulation_schedules(sentences, visemes: viseme_map, fps: float, scene_fps: float = None, first: bool = False,
+                             merge: bool = False, tag: str = '', loudness=None, rest: np.ndarray = None,
+                             kernel: blend_kernel = None, simplify=None) -> list[sentence_schedule]:
+    '''
+    調音結合
+    ファイルの全ての文のフレームごとに(フレーム数, 口形素数)の重みを作り、restからのポーズの差分を混ぜた値をキーにする
+    重なった音素は優位度の比で分け合い、全体の強さは最も強い音素の強さにする（重なっても1を超えない）
+    文の最後の音素の後は次の文の範囲の手前まで減衰させ、減衰しきらないときは最後のフレームでrestに戻す
+    値が変わらない区間は両端のキーだけを残す
+    rest : チャンネルごとの基準の値（シェイプキーは0、リグはchannel_rest()）
+    kernel : 発音の前後の立ち上がりと減衰
+    simplify : simplify(frames, values, fixed=...) -> 残すキーの真偽値。文ごとにチャンネルごとの曲線を連結して渡す
+               値はチャンネルごとのポーズの差分の大きさで割ったもの、fixedは各曲線の両端。Noneなら間引かない
+    '''
+    kernel = kernel or blend_kernel()
+    scene_fps = scene_fps or fps
+    if rest is None:
+        rest = np.zeros(len(visemes.channels))
+    names = list(visemes.poses)
+    dominances = np.array([dominance(p) for p in names])
+    _, lengths, offsets, pose_channels, pose_values = visemes._flatten()
+
+    # 文ごとの発音と、影響するフレームの範囲
+    count = len(sentences)
+    rows = []
+    starts = np.zeros(count)
+    cut = np.zeros(count, dtype=bool)
+    signatures = []
+    for i, words in enumerate(sentences):
+        table = words.table
+        all_ids = visemes.pose_ids(words, first and i == 0)
+        ids, timingB, timingE = all_ids, table.timingB, table.timingE
+        if merge:
+            ids, timingB, timingE = merge_holds(ids, timingB, timingE)
+        gain = loudness.gain(timingB, timingE) if loudness is not None else None
+        posed = ids >= 0
+        # 隣の文のストリップと重ならないよう、文の始まりから次の文の始まりの手前までに収める
+        begin = table.timingB[0] if len(table) else 0.0
+        until = sentences[i + 1].table.timingB[0] if i + 1 < count and len(sentences[i + 1].table) else np.inf
+        lead = min(timingB[posed][0] - begin, kernel.attack) if posed.any() else 0.0
+        tail = min(until - timingE[posed][-1], kernel.decay) if posed.any() else 0.0
+        signatures.append(fingerprint(words, all_ids, visemes, fps, scene_fps,
+                                      tag + f"+coarticulation={kernel!r}+extent={lead:.6f},{tail:.6f}"
+                                      + ("+merge" if merge else ""), gain))
+        if not posed.any():
+            starts[i] = _start_frame(table, timingB, timingE, scene_fps, first and i == 0)
+            continue
+        low = int(np.ceil(begin * fps))
+        fade = np.ceil((timingE[posed][-1] + kernel.decay) * fps)
+        high = int(min(fade, np.ceil(until * fps) - 1))
+        cut[i] = fade > high
+        rows.append((i, ids[posed], timingB[posed], timingE[posed],
+                     gain[posed] if gain is not None else np.ones(int(posed.sum())), low, high))
+
+    schedules = [sentence_schedule(np.empty(0, dtype=np.int32), np.empty(0), np.empty(0), starts[i], signatures[i])
+                 for i in range(count)]
+    if not rows:
+        return schedules
+    sentence = np.concatenate([np.full(len(r[1]), r[0]) for r in rows])
+    ids = np.concatenate([r[1] for r in rows])
+    b = np.concatenate([r[2] for r in rows])
+    e = np.concatenate([r[3] for r in rows])
+    g = np.concatenate([r[4] for r in rows])
+    low = np.repeat([r[5] for r in rows], [len(r[1]) for r in rows])
+    high = np.repeat([r[6] for r in rows], [len(r[1]) for r in rows])
+    lo = np.clip(np.floor((b - kernel.attack) * fps).astype(np.int64), low, high)
+    hi = np.clip(np.ceil((e + kernel.decay) * fps).astype(np.int64), low, high)
+
+    # 文ごとのフレームの範囲を詰めて並べた格子。originは文の最初のフレーム、baseは格子での位置
+    used = np.unique(sentence)
+    origin = np.full(count, np.iinfo(np.int64).max)
+    np.minimum.at(origin, sentence, lo)
+    last = np.full(count, -1)
+    np.maximum.at(last, sentence, hi)
+    size = np.where(np.isin(np.arange(count), used), last - origin + 1, 0)
+    base = np.cumsum(size) - size
+    n = int(size.sum())
+
+    # (音素, フレーム)の組ごとの強さ
+    counts = hi - lo + 1
+    row = np.repeat(np.arange(len(b)), counts)
+    frame = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + lo[row]
+    t = frame / fps
+    strength = kernel.activation(np.maximum(b[row] - t, 0.0), np.maximum(t - e[row], 0.0))
+
+    # 分け合う比は強さの2乗で重み付けし、発音から離れた音素ほど早く譲るようにする
+    visible, local = np.unique(ids, return_inverse=True)
+    v = len(visible)
+    weight = dominances[ids][row] * strength * strength
+    cell = frame - origin[sentence][row] + base[sentence][row]
+    mixed = np.bincount(cell * v + local[row], weights=weight * g[row], minlength=n * v).reshape(n, v)
+    total = np.bincount(cell, weights=weight, minlength=n)
+    envelope = np.zeros(n)
+    np.maximum.at(envelope, cell, strength)
+    mixed *= np.divide(envelope, total, out=np.zeros(n), where=total > 0)[:, None]
+    # 次の文が近くて減衰しきらない文は、最後のフレームでrestに戻す
+    mixed[(base + size - 1)[cut]] = 0.0
+
+    # 口形素ごとのrestからの差分 (口形素数, チャンネル数)
+    pick = np.concatenate([np.arange(offsets[p], offsets[p] + lengths[p]) for p in visible.tolist()])
+    channels, column = np.unique(pose_channels[pick], return_inverse=True)
+    delta = np.zeros((v, len(channels)))
+    owner = np.repeat(np.arange(v), lengths[visible])
+    delta[owner, column] = pose_values[pick] - rest[pose_channels[pick]]
+
+    # 文ごとに、出てくる口形素のチャンネルだけ残す
+    appears = np.zeros((count, v), dtype=bool)
+    appears[sentence, local] = True
+    pose_channel = np.zeros((v, len(channels)), dtype=bool)
+    pose_channel[owner, column] = True
+    owns = (appears.astype(np.int64) @ pose_channel) > 0  # (文数, チャンネル数)
+    scale = np.abs(delta).max(axis=0)
+    scale[scale == 0] = 1.0
+
+    for i in used.tolist():
+        own = np.flatnonzero(owns[i])
+        values = rest[channels[own]] + mixed[base[i]:base[i] + size[i]] @ delta[:, own]  # (フレーム数, チャンネル数)
+        # 値が変わらない区間の内側のキーを除く。文の両端のフレームは残す
+        keep = np.ones(values.shape, dtype=bool)
+        if size[i] > 2:
+            keep[1:-1] = (values[1:-1] != values[:-2]) | (values[1:-1] != values[2:])
+        col, pos = np.nonzero(keep.T)  # チャンネル、フレーム順
+        key_frames = (pos + origin[i]).astype(np.float64)
+        key_values = values.T[col, pos]
+        if simplify is not None and len(pos) > 2:
+            # チャンネルごとの曲線の両端は残す
+            joint = col[1:] != col[:-1]
+            reduced = simplify(key_frames, key_values / scale[own][col],
+                               fixed=np.r_[True, joint] | np.r_[joint, True])
+            col, key_frames, key_values = col[reduced], key_frames[reduced], key_values[reduced]
+        schedules[i] = sentence_schedule(channels[own][col].astype(np.int32), key_frames, key_values,
+                                         origin[i] / fps * scene_fps, signatures[i])
+    return schedules
+
+
+def merge_schedules(schedules: list[sentence_schedule]) -> sentence_schedule:
+    '''
+    複数の文の予定表を1つにまとめる
+    キーのフレームはファイル先頭からなので、そのまま連結できる
+    '''
+    h = hashlib.blake2b(digest_size=16)
+    origin = schedules[0].start
+    for s in schedules:
+        h.update(s.fingerprint.encode())
+        h.update(np.float64(s.start - origin).tobytes())
+    bounds = [float(s.frames.min()) for s in schedules if len(s)]
+    channels, frames, values = _dedupe(np.concatenate([s.channels for s in schedules]),
+                                       np.concatenate([s.frames for s in schedules]),
+                                       np.concatenate([s.values for s in schedules]))
+    return sentence_schedule(channels, frames, values, origin, h.hexdigest(), bounds)
+
+
+def chunk_schedules(schedules: list[sentence_schedule], length: float = None) -> list[sentence_schedule]:
+    '''
+    文の予定表をlengthフレーム（シーンのフレームレート）ごとにまとめる
+    文の途中では区切らない。lengthがNoneなら全てを1つにまとめる
+    '''
+    chunks: list[list[sentence_schedule]] = []
+    for s in schedules:
+        if chunks and (length is None or s.start - chunks[-1][0].start < length):
+            chunks[-1].append(s)
+        else:
+            chunks.append([s])
+    return [merge_schedules(c) for c in chunks]
+
+
+def pack_schedules(schedules: list[sentence_schedule]) -> dict[str, np.ndarray]:
+    # 予定表の並びを連結した配列の辞書にする（.npzに保存する）
+    def concat(arrays, dtype):
+        return np.concatenate([np.asarray(a, dtype=dtype) for a in arrays] + [np.empty(0, dtype=dtype)])
+    return {
+        "lengths": np.array([len(s) for s in schedules], dtype=np.int64),
+        "channels": concat([s.channels for s in schedules], np.int32),
+        "frames": concat([s.frames for s in schedules], np.float64),
+        "values": concat([s.values for s in schedules], np.float64),
+        "starts": np.array([s.start for s in schedules], dtype=np.float64),
+        "fingerprints": np.array([s.fingerprint for s in schedules], dtype=str),
+        "has_bounds": np.array([s.bounds is not None for s in schedules], dtype=bool),
+        "bound_counts": np.array([len(s.bounds or ()) for s in schedules], dtype=np.int64),
+        "bounds": concat([s.bounds or () for s in schedules], np.float64),
+    }
+
+
+def unpack_schedules(arrays: dict[str, np.ndarray]) -> list[sentence_schedule]:
+    lengths = arrays["lengths"]
+    splits = np.cumsum(lengths)[:-1]
+    channels = np.split(arrays["channels"], splits)
+    frames = np.split(arrays["frames"], splits)
+    values = np.split(arrays["values"], splits)
+    bounds = np.split(arrays["bounds"], np.cumsum(arrays["bound_counts"])[:-1])
+    return [sentence_schedule(channels[i], frames[i], values[i], float(arrays["starts"][i]),
+                              str(arrays["fingerprints"][i]),
+                              bounds[i].tolist() if arrays["has_bounds"][i] else None)
+            for i in range(len(lengths))]
+
+
+def schedule(sentences, visemes: viseme_map, fps: float, target: str, scene_fps: float = None) -> list[sentence_schedule]:
+    '''
+    ファイルの全ての文の予定表を作る
+    target : 'ARMATURE' か 'MESH'
+    '''
+    func = rig_schedule if target == 'ARMATURE' else shapekey_schedule
+    return [func(words, visemes, fps, scene_fps, i == 0) for i, words in enumerate(sentences)]
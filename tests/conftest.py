@@ -0,0 +1,5 @@
+import os
+import sys
+
+# bpyに依存しないモジュール（lab, schedule, keyframe）をパッケージの外から読み込む
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
@@ -0,0 +1,33 @@
+import os
+
+import cache
+import lab
+
+
+def load(filepath):
+    words = lab.load(filepath)
+    return words, words.split()
+
+
+def test_lab_cache_reloads_when_sidecar_changes(tmp_path):
+    path = tmp_path / 'x.lab'
+    path.write_text('0 1000000 pau\n1000000 2000000 a\n')
+    labs = cache.lab_cache()
+    sidecar = lab.sidecar_path(str(path))
+    assert labs.get(str(path), load, sidecar)[0].table.phonemes() == ['pau', 'a']
+    labs.get(str(path), load, sidecar)
+    assert (labs.hits, labs.misses) == (1, 1)
+
+    lab.save_binary(lab.lab_table.from_seconds([0.0], [0.1], ['N']), sidecar)
+    st = os.stat(path)
+    os.utime(sidecar, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+    assert labs.get(str(path), load, sidecar)[0].table.phonemes() == ['N']
+    assert labs.misses == 2
+
+
+def test_lab_cache_fits_by_file_size(tmp_path):
+    path = tmp_path / 'x.lab'
+    path.write_text('0 1000000 pau\n1000000 2000000 a\n')
+    assert cache.lab_cache(budget=1 << 20).fits(str(path))
+    assert not cache.lab_cache(budget=16).fits(str(path))
+    assert not cache.lab_cache().fits(str(tmp_path / 'missing.lab'))
@@ -0,0 +1,51 @@
+import os
+import sys
+import types
+
+# 挿入処理はbpyの代わり（benchmarks/fakebpy.py）で動かす
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'benchmarks'))
+import throughput  # noqa: E402
+
+
+def context(obj, interpolation: str, disk_cache_dir: str = ''):
+    prefs = types.SimpleNamespace(cache_budget=0, cache_hash=False, disk_cache_dir=disk_cache_dir,
+                                  disk_cache_limit=64)
+    return types.SimpleNamespace(
+        active_object=obj,
+        scene=types.SimpleNamespace(render=types.SimpleNamespace(fps=30), frame_current=1),
+        preferences=types.SimpleNamespace(edit=types.SimpleNamespace(keyframe_new_interpolation_type=interpolation),
+                                          addons={'import_lab': types.SimpleNamespace(preferences=prefs)}))
+
+
+def test_disk_cache_misses_when_interpolation_changes(tmp_path):
+    addon = throughput.load_addon()
+    path = str(tmp_path / 'x.lab')
+    throughput.synth.write(path, 10.0, 0)
+    obj, profile = throughput.make_target(addon, 'MESH')
+    op = throughput.make_operator(addon, 'MESH', False, False)
+    directory = str(tmp_path / 'cache')
+
+    def schedules(interpolation):
+        ctx = context(obj, interpolation, directory)
+        return op.file_schedules(ctx, path, op.build_visemes(ctx, profile))
+
+    bezier = schedules('BEZIER')
+    assert [s.fingerprint for s in schedules('BEZIER')] == [s.fingerprint for s in bezier]
+    assert op.trace.counters.get('disk_hits') == 1
+    linear = schedules('LINEAR')
+    assert op.trace.counters.get('disk_misses') == 2
+    assert linear[0].fingerprint != bezier[0].fingerprint
+
+
+def test_profile_follows_replaced_pose_action():
+    addon = throughput.load_addon()
+    fakebpy = throughput.fakebpy
+    data = types.SimpleNamespace(as_pointer=lambda: 1)
+    slot = types.SimpleNamespace(viseme='a', pose=fakebpy.Action('a'))
+    data.implab_props = types.SimpleNamespace(
+        vowel_list=[slot], consonants_list=[types.SimpleNamespace(viseme='N', pose=fakebpy.Action('N'))], id_data=data)
+    addon.cache.profiles.invalidate()
+    assert addon.get_profile(data) is addon.get_profile(data)
+    # 同じ名前のアクションに置き換える
+    slot.pose = fakebpy.Action('a')
+    assert addon.get_profile(data).mapping['a'] is slot.pose
@@ -0,0 +1,26 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import instrument
+
+
+def test_worker_time_is_kept_out_of_total():
+    trace = instrument.trace()
+
+    def work(_):
+        with trace.stage("parse"):
+            time.sleep(0.05)
+
+    start = time.perf_counter()
+    with trace.stage("wait_load"):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(work, range(4)))
+    wall = time.perf_counter() - start
+
+    assert "parse" not in trace.stages
+    assert trace.worker_stages["parse"][1] == 4
+    assert trace.total() <= wall
+    assert trace.worker_total() > wall
+    data = trace.to_dict()
+    assert data["worker_stages"]["parse"]["calls"] == 4
+    assert data["total"] <= data["wall"]
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+import keyframe
+
+
+def curve(seed: int, n: int = 400):
+    r = np.random.default_rng(seed)
+    frames = np.cumsum(r.integers(1, 4, n)).astype(np.float64)
+    steps = r.normal(0, 0.004, n)
+    steps[r.random(n) < 0.3] = 0.0  # 同じ値が続く区間も混ぜる
+    return frames, np.cumsum(steps)
+
+
+def reconstruct(frames, values, keep, interpolation):
+    f, v = frames[keep], values[keep]
+    if interpolation == 'CONSTANT':
+        return v[np.searchsorted(f, frames, side='right') - 1]
+    return np.interp(frames, f, v)
+
+
+@pytest.mark.parametrize('interpolation', ['LINEAR', 'CONSTANT'])
+@pytest.mark.parametrize('seed', range(5))
+def test_decimate_error_bound(seed, interpolation):
+    frames, values = curve(seed)
+    tolerance = 0.005
+    keep = keyframe.decimate(frames, values, tolerance, interpolation)
+    assert keep[0] and keep[-1]
+    assert keep.sum() < len(keep)
+    error = np.abs(reconstruct(frames, values, keep, interpolation) - values)
+    assert error.max() <= tolerance + 1e-12
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_decimate_bezier_keeps_plateau_ends(seed):
+    frames, values = curve(seed)
+    keep = keyframe.decimate(frames, values, 0.005, 'BEZIER')
+    f, v = frames[keep], values[keep]
+    # 消したキーは前後に残したキーのどちらともtolerance以内
+    segment = np.searchsorted(f, frames, side='right') - 1
+    inner = ~keep
+    left, right = v[segment[inner]], v[segment[inner] + 1]
+    assert np.abs(values[inner] - left).max() <= 0.005
+    assert np.abs(values[inner] - right).max() <= 0.005
+
+
+def test_decimate_short():
+    assert keyframe.decimate([0, 1], [0, 1]).tolist() == [True, True]
+    assert keyframe.decimate([0, 1, 2], [0, 0, 0], 0.001, 'LINEAR').tolist() == [True, False, True]
+
+
+def test_decimate_fixed_joins_curves():
+    # 2本の曲線をつなげて間引いても、1本ずつ間引いたのと同じになる
+    curves = [curve(seed, 50) for seed in range(2)]
+    frames = np.concatenate([f for f, _ in curves])
+    values = np.concatenate([v for _, v in curves])
+    fixed = np.zeros(len(frames), dtype=bool)
+    fixed[[0, 49, 50, 99]] = True
+    keep = keyframe.decimate(frames, values, 0.005, 'LINEAR', fixed)
+    assert keep.tolist() == np.concatenate([keyframe.decimate(f, v, 0.005, 'LINEAR') for f, v in curves]).tolist()
@@ -0,0 +1,231 @@
+import random
+
+import numpy as np
+import pytest
+
+import lab
+
+
+def table(phonemes) -> lab.lab_table:
+    t = np.arange(len(phonemes) + 1) * 0.1
+    return lab.lab_table.from_seconds(t[:-1], t[1:], phonemes)
+
+
+def reference_split(table: lab.lab_table, sensitive: bool = False) -> list[tuple[int, int]]:
+    # ベクトル化する前のlab_words.split()
+    ranges = []
+    pau = 0
+    s, e = 0, 0
+    sen = 0 if sensitive else 1
+    pau_id = table.id_of("pau")
+    for id in table.ids.tolist():
+        if id == pau_id:
+            pau += 1
+        else:
+            if pau > sen:
+                end = e - pau
+                if s < end:
+                    ranges.append((s, end))
+                    s = e - 1
+            pau = 0
+        e += 1
+    if len(ranges) != 0:
+        ranges.append((s, e - pau))
+    return ranges
+
+
+CASES = [
+    [],
+    ['pau'],
+    ['pau', 'a', 'pau'],
+    ['pau', 'a', 'pau', 'pau', 'i', 'pau'],
+    ['a', 'pau', 'pau', 'i'],
+    ['pau', 'pau', 'a', 'pau', 'i', 'pau', 'pau', 'pau', 'u', 'pau', 'pau'],
+    ['a', 'pau', 'i', 'pau', 'u'],
+    ['k', 'a'],
+]
+
+
+@pytest.mark.parametrize('sensitive', [False, True])
+@pytest.mark.parametrize('phonemes', CASES)
+def test_sentence_ranges_match_reference(phonemes, sensitive):
+    t = table(phonemes)
+    assert t.sentence_ranges(sensitive).tolist() == [list(r) for r in reference_split(t, sensitive)]
+
+
+@pytest.mark.parametrize('sensitive', [False, True])
+def test_sentence_ranges_match_reference_random(sensitive):
+    r = random.Random(0)
+    for _ in range(200):
+        phonemes = [r.choice(['pau', 'pau', 'a', 'k', 'N']) for _ in range(r.randrange(0, 40))]
+        t = table(phonemes)
+        assert t.sentence_ranges(sensitive).tolist() == [list(x) for x in reference_split(t, sensitive)]
+
+
+def test_split_views_share_table():
+    w = lab.lab_words(table=table(['pau', 'a', 'pau', 'pau', 'i', 'pau']))
+    sentences = w.split()
+    assert [s.table.phonemes() for s in sentences] == [['pau', 'a'], ['pau', 'i']]
+    assert all(s.table.symbols is w.table.symbols for s in sentences)
+
+
+def test_binary_round_trip(tmp_path):
+    source = table(['pau', 'k', 'a', 'pau', 'pau', 'N', 'pau'])
+    path = str(tmp_path / 'x.lab.labbin')
+    lab.save_binary(source, path)
+    loaded = lab.load_binary(path).table
+    assert loaded.symbols == source.symbols
+    assert loaded.begin.tolist() == source.begin.tolist()
+    assert loaded.end.tolist() == source.end.tolist()
+    assert loaded.phonemes() == source.phonemes()
+
+
+def test_binary_round_trip_empty(tmp_path):
+    path = str(tmp_path / 'x.lab.labbin')
+    lab.save_binary(lab.lab_table(), path)
+    assert len(lab.load_binary(path).table) == 0
+
+
+def test_sidecar_keeps_source_extension(tmp_path):
+    assert lab.sidecar_path('foo.lab') != lab.sidecar_path('foo.json')
+    path = tmp_path / 'x.lab'
+    path.write_text('0 1000000 pau\n1000000 2000000 a\n')
+    assert lab.sidecar(str(path)) is None
+    sidecar = lab.convert(str(path))
+    assert lab.sidecar(str(path)) == sidecar
+    assert lab.load(str(path)).table.phonemes() == ['pau', 'a']
+    assert lab.sidecar(str(tmp_path / 'x.json')) is None
+
+
+def test_overwrite_keeps_mapped_sidecar(tmp_path):
+    path = str(tmp_path / 'x.lab.labbin')
+    lab.save_binary(table(['pau', 'a', 'i', 'pau']), path)
+    mapped = lab.load_binary(path).table
+    lab.save_binary(table(['pau']), path)
+    assert mapped.phonemes() == ['pau', 'a', 'i', 'pau']
+    assert lab.load_binary(path).table.phonemes() == ['pau']
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['x.lab.labbin']
+
+
+def write(tmp_path, name: str, text: str, encoding: str = 'utf-8') -> str:
+    path = tmp_path / name
+    path.write_bytes(text.encode(encoding))
+    return str(path)
+
+
+def test_native_lab(tmp_path):
+    path = write(tmp_path, 'x.lab', '0 1000000 pau\n1000000 2500000 a\n2500000 3000000 pau\n')
+    assert lab.native(path)
+    t = lab.read(path)
+    assert t.phonemes() == ['pau', 'a', 'pau']
+    assert t.begin.tolist() == [0, 1000000, 2500000]
+
+
+@pytest.mark.parametrize('text', ['0.0 0.5 silB\n0.5 0.6 k\n0.6 0.9 a\n0.9 1.2 silE\n',
+                                  '0 0.5 silB\n0.5 0.6 k\n0.6 0.9 a\n0.9 1.2 silE\n'])
+def test_htk(tmp_path, text):
+    path = write(tmp_path, 'x.lab', text)
+    assert not lab.native(path)
+    t = lab.read(path)
+    assert t.phonemes() == ['pau', 'k', 'a', 'pau']
+    assert t.end.tolist() == [5000000, 6000000, 9000000, 12000000]
+
+
+TEXTGRID_LONG = '''File type = "ooTextFile"
+Object class = "TextGrid"
+
+xmin = 0
+xmax = 1.2
+tiers? <exists>
+size = 2
+item []:
+    item [1]:
+        class = "IntervalTier"
+        name = "words"
+        xmin = 0
+        xmax = 1.2
+        intervals: size = 1
+        intervals [1]:
+            xmin = 0
+            xmax = 1.2
+            text = "ka"
+    item [2]:
+        class = "IntervalTier"
+        name = "phones"
+        xmin = 0
+        xmax = 1.2
+        intervals: size = 4
+        intervals [1]:
+            xmin = 0
+            xmax = 0.5
+            text = ""
+        intervals [2]:
+            xmin = 0.5
+            xmax = 0.6
+            text = "k"
+        intervals [3]:
+            xmin = 0.6
+            xmax = 0.9
+            text = "a"
+        intervals [4]:
+            xmin = 0.9
+            xmax = 1.2
+            text = "sil"
+'''
+
+TEXTGRID_SHORT = '''File type = "ooTextFile"
+Object class = "TextGrid"
+
+0
+1.2
+<exists>
+1
+"IntervalTier"
+"phones"
+0
+1.2
+4
+0
+0.5
+""
+0.5
+0.6
+"k"
+0.6
+0.9
+"a"
+0.9
+1.2
+"sil"
+'''
+
+
+@pytest.mark.parametrize('text', [TEXTGRID_LONG, TEXTGRID_SHORT])
+@pytest.mark.parametrize('encoding', ['utf-8', 'utf-16'])
+def test_textgrid(tmp_path, text, encoding):
+    t = lab.read(write(tmp_path, 'x.TextGrid', text, encoding))
+    assert t.phonemes() == ['pau', 'k', 'a', 'pau']
+    assert t.begin.tolist() == [0, 5000000, 6000000, 9000000]
+
+
+QUERY = '''{"accent_phrases": [
+  {"moras": [{"text": "カ", "consonant": "k", "consonant_length": 0.1, "vowel": "a", "vowel_length": 0.2},
+             {"text": "シ", "consonant": "sh", "consonant_length": 0.1, "vowel": "I", "vowel_length": 0.1}],
+   "accent": 1, "pause_mora": {"text": "、", "consonant": null, "consonant_length": null, "vowel": "pau", "vowel_length": 0.3}},
+  {"moras": [{"text": "ン", "consonant": null, "consonant_length": null, "vowel": "N", "vowel_length": 0.1}],
+   "accent": 1, "pause_mora": null}],
+ "speedScale": 2.0, "prePhonemeLength": 0.2, "postPhonemeLength": 0.4}
+'''
+
+
+def test_voicevox_query(tmp_path):
+    path = write(tmp_path, 'x.json', QUERY)
+    assert lab.readable(path)
+    t = lab.read(path)
+    assert t.phonemes() == ['pau', 'k', 'a', 'sh', 'I', 'pau', 'N', 'pau']
+    assert np.allclose(t.timingE, np.cumsum([0.2, 0.1, 0.2, 0.1, 0.1, 0.3, 0.1, 0.4]) / 2.0)
+
+
+def test_readable_rejects_other_json(tmp_path):
+    assert not lab.readable(write(tmp_path, 'settings.json', '{"name": "settings"}'))
+    assert lab.readable(write(tmp_path, 'x.lab', '0 1000000 pau\n'))
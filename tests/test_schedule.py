@@ -0,0 +1,93 @@
+from functools import partial
+
+import numpy as np
+import pytest
+
+import keyframe
+import lab
+import schedule
+
+T = lab.TICKS_PER_SECOND
+
+
+def words(rows) -> lab.lab_words:
+    # (開始秒, 終了秒, 音素)の並びから
+    begin, end, phonemes = zip(*rows)
+    return lab.lab_words(table=lab.lab_table.from_seconds(begin, end, phonemes))
+
+
+def visemes() -> schedule.viseme_map:
+    v = schedule.viseme_map()
+    for p in ('a', 'i', 'N', 'k'):
+        v.set_pose(p, [v.channel(f'key_blocks["{p}"].value')], [1.0])
+    return v
+
+
+def sentence(lead: float, shift: float = 0.0):
+    return words([(shift, shift + lead, 'pau'),
+                  (shift + lead, shift + lead + 0.08, 'k'),
+                  (shift + lead + 0.08, shift + lead + 0.3, 'a'),
+                  (shift + lead + 0.3, shift + lead + 0.4, 'i'),
+                  (shift + lead + 0.4, shift + lead + 1.0, 'pau')])
+
+
+def test_fingerprint_ignores_leading_pause():
+    v = visemes()
+    a = schedule.shapekey_schedule(sentence(0.2), v, 30)
+    b = schedule.shapekey_schedule(sentence(0.5), v, 30)
+    assert a.fingerprint == b.fingerprint
+    assert b.start - a.start == pytest.approx(0.3 * 30)
+
+
+def test_fingerprint_changes_with_content():
+    v = visemes()
+    a = schedule.shapekey_schedule(sentence(0.2), v, 30)
+    changed = words([(0.0, 0.2, 'pau'), (0.2, 0.28, 'k'), (0.28, 0.5, 'i'), (0.5, 0.6, 'i'), (0.6, 1.2, 'pau')])
+    assert schedule.shapekey_schedule(changed, v, 30).fingerprint != a.fingerprint
+    assert schedule.shapekey_schedule(sentence(0.2), v, 24).fingerprint != a.fingerprint
+
+
+def two_sentences(gap: float):
+    # sentence(0.2)の後にgap秒のpauを挟んでもう1文
+    return words([(0.0, 0.2, 'pau'), (0.2, 0.28, 'k'), (0.28, 0.5, 'a'), (0.5, 0.6, 'i'),
+                  (0.6, 0.6 + gap / 2, 'pau'), (0.6 + gap / 2, 0.6 + gap, 'pau'),
+                  (0.6 + gap, 0.68 + gap, 'k'), (0.68 + gap, 0.9 + gap, 'a'), (0.9 + gap, 1.5 + gap, 'pau')]).split()
+
+
+@pytest.mark.parametrize('gap', [1.0, 0.06])
+def test_coarticulation_returns_to_rest(gap):
+    a, b = schedule.coarticulation_schedules(two_sentences(gap), visemes(), 30)
+    for s in (a, b):
+        for channel, frames, values in s.curves():
+            assert values[-1] == 0.0
+    # 次の文のストリップと重ならない
+    assert a.frames.max() < b.frames.min()
+
+
+def test_coarticulation_simplify_error():
+    v = visemes()
+    sentences = two_sentences(1.0)
+    dense = schedule.coarticulation_schedules(sentences, v, 30)
+    simplified = schedule.coarticulation_schedules(
+        sentences, v, 30, simplify=partial(keyframe.decimate, tolerance=0.01, interpolation='LINEAR'))
+    for d, s in zip(dense, simplified):
+        assert len(s) < len(d)
+        for (c, f, x), (_, g, y) in zip(d.curves(), s.curves()):
+            assert np.abs(np.interp(f, g, y) - x).max() <= 0.01
+
+
+def test_coarticulation_fingerprint_ignores_leading_pause():
+    v = visemes()
+    a = schedule.coarticulation_schedules([sentence(0.2)], v, 30)[0]
+    b = schedule.coarticulation_schedules([sentence(0.5)], v, 30)[0]
+    assert a.fingerprint == b.fingerprint
+    assert b.start - a.start == pytest.approx(0.3 * 30)
+
+
+def test_channel_ignores_group():
+    # 同じF-カーブを別のグループでキーにしたポーズがあっても1つのチャンネルにする
+    v = schedule.viseme_map()
+    v.set_template('a', schedule.pose_template([('pose.bones["jaw"].location', 1, '口1')], [0.5]))
+    v.set_template('i', schedule.pose_template([('pose.bones["jaw"].location', 1, '')], [0.2]))
+    assert v.channels == [('pose.bones["jaw"].location', 1, '口1')]
+    assert v.poses['a'][0].tolist() == v.poses['i'][0].tolist() == [0]